@@ -1,8 +1,8 @@
 """Configuration settings for the application."""
 
 from pydantic_settings import BaseSettings
-from typing import List
-import os
+from functools import cached_property, lru_cache
+from typing import Tuple
 
 
 class Settings(BaseSettings):
@@ -35,19 +35,22 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-    @property
-    def allowed_file_types_list(self) -> List[str]:
-        """Get list of allowed file types."""
-        return [ext.strip() for ext in self.ALLOWED_FILE_TYPES.split(",")]
+    @cached_property
+    def allowed_file_types_list(self) -> Tuple[str, ...]:
+        """Get allowed file types (parsed once)."""
+        return tuple(ext.strip() for ext in self.ALLOWED_FILE_TYPES.split(","))
 
-    @property
-    def cors_origins_list(self) -> List[str]:
-        """Get list of CORS origins."""
-        return [origin.strip() for origin in self.CORS_ORIGINS.split(",")]
+    @cached_property
+    def cors_origins_list(self) -> Tuple[str, ...]:
+        """Get CORS origins (parsed once)."""
+        return tuple(origin.strip() for origin in self.CORS_ORIGINS.split(","))
 
 
-# Create settings instance
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Get the application settings (created once and cached)."""
+    return Settings()
+
 
-# Ensure catalog directory exists
-os.makedirs(settings.CATALOG_DIR, exist_ok=True)
+# Create settings instance
+settings = get_settings()
@@ -1,24 +1,59 @@
 """Database connection and session management."""
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
 from app.config import settings
+import orjson
+
+# JSON columns (tool_calls, metadata_json) are encoded with orjson, accepting numpy
+# scalars (e.g. pandas stats) and non-string dict keys
+_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _json_serializer(obj) -> str:
+    """Encode a JSON column value."""
+    return orjson.dumps(obj, option=_JSON_OPTIONS).decode()
+
 
 # Create database engine
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+    pool_size=20,
+    max_overflow=20,
+    pool_timeout=30,  # Seconds a request waits for a connection before failing
+    pool_pre_ping=True,
+    pool_use_lifo=True,  # Reuse the most recently returned connection so idle ones can age out
+    pool_recycle=1800,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
 )
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so reads proceed during writes, and give each connection more cache and mmap."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        cursor.execute("PRAGMA cache_size=-65536")  # 64 MiB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
 
-# Base class for models
-Base = declarative_base()
+# Create session factory (attributes stay loaded after commit, avoiding a reload SELECT)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+
+class Base(DeclarativeBase):
+    """Base class for models."""
 
 
 def get_db():
     """Dependency for getting database session."""
+    # Routes commit their own writes. FastAPI 0.104 runs this
+    # teardown after the response has been sent, so a commit here could not fail the request.
     db = SessionLocal()
     try:
         yield db
@@ -26,7 +61,44 @@ def get_db():
         db.close()
 
 
+# (table, column) pairs added to models after their tables were first created
+_ADDED_COLUMNS = (
+    ("chat_messages", "sql_query"),
+    ("chat_messages", "sql_file_id"),
+    ("files", "status"),
+)
+
+
 def init_db():
     """Initialize database tables."""
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any columns and indexes declared since
+    _add_missing_columns()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _add_missing_columns():
+    """ALTER TABLE ... ADD COLUMN for each of _ADDED_COLUMNS an existing table lacks."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table_name, column_name in _ADDED_COLUMNS:
+            existing = {column["name"] for column in inspector.get_columns(table_name)}
+            if column_name in existing:
+                continue
+            column = Base.metadata.tables[table_name].c[column_name]
+            column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_ddl}"))
 
+
+def warm_pool():
+    """Open the pool's connections up front so early requests skip connection setup."""
+    pool_size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+    connections = [engine.connect() for _ in range(pool_size)]
+    try:
+        for conn in connections:
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,11 @@
+"""Shared column types."""
+from sqlalchemy import JSON, String, Uuid
+from sqlalchemy.dialects.postgresql import JSONB
+
+# JSON column stored as JSONB on PostgreSQL; Python None is written as SQL NULL
+# rather than the JSON literal 'null'
+JSONColumn = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
+# UUID key: native uuid on PostgreSQL. SQLite keeps the dashed 36-char strings that existing
+# databases already hold, since its Uuid type would store (and look up) 32-char hex instead
+UUIDColumn = Uuid(as_uuid=False).with_variant(String(36), "sqlite")
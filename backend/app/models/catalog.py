@@ -1,8 +1,9 @@
 """File and catalog models."""
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
+from app.database.types import JSONColumn, UUIDColumn
 import uuid
 
 
@@ -11,27 +12,28 @@ class File(Base):
     __tablename__ = "files"
     
     file_id = Column(String, primary_key=True)
-    user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
+    user_id = Column(UUIDColumn, ForeignKey("users.user_id"), nullable=False, index=True)
     original_filename = Column(String, nullable=False)
     file_type = Column(String, nullable=False)  # csv or json
     file_path = Column(String, nullable=False)
-    row_count = Column(Integer, nullable=True)
+    row_count = Column(Integer, nullable=True)  # set once processing finishes
+    status = Column(String, nullable=False, default="uploaded", server_default="uploaded")  # processing, uploaded or failed
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    catalog = relationship("Catalog", back_populates="file", uselist=False)
+    catalog = relationship("Catalog", back_populates="file", uselist=False, lazy="selectin")
 
 
 class Catalog(Base):
     """Catalog model."""
     __tablename__ = "catalogs"
     
-    catalog_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    catalog_id = Column(UUIDColumn, primary_key=True, default=lambda: str(uuid.uuid4()))
     file_id = Column(String, ForeignKey("files.file_id"), nullable=False, unique=True)
     summary = Column(Text, nullable=False)
-    metadata_json = Column(JSON, nullable=True)
+    metadata_json = Column(JSONColumn, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    file = relationship("File", back_populates="catalog")
+    file = relationship("File", back_populates="catalog", lazy="raise")
 
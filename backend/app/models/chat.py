@@ -1,8 +1,9 @@
 """Chat models."""
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
+from app.database.types import JSONColumn, UUIDColumn
 import uuid
 
 
@@ -10,25 +11,33 @@ class ChatSession(Base):
     """Chat session model."""
     __tablename__ = "chat_sessions"
     
-    session_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
+    session_id = Column(UUIDColumn, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(UUIDColumn, ForeignKey("users.user_id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    messages = relationship(
+        "ChatMessage", back_populates="session", cascade="all, delete-orphan", order_by="ChatMessage.created_at"
+    )
 
 
 class ChatMessage(Base):
     """Chat message model."""
     __tablename__ = "chat_messages"
     
-    message_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    session_id = Column(String, ForeignKey("chat_sessions.session_id"), nullable=False)
+    message_id = Column(UUIDColumn, primary_key=True, default=lambda: str(uuid.uuid4()))
+    session_id = Column(UUIDColumn, ForeignKey("chat_sessions.session_id"), nullable=False)
     role = Column(String, nullable=False)  # user or assistant
     content = Column(Text, nullable=False)
-    tool_calls = Column(JSON, nullable=True)
+    tool_calls = Column(JSONColumn, nullable=True)
+    # Copied out of tool_calls for data-query replies so lookups skip JSON decoding
+    sql_query = Column(Text, nullable=True)
+    sql_file_id = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     session = relationship("ChatSession", back_populates="messages")
 
+    # Serves "latest N messages of a session" without sorting the whole history
+    __table_args__ = (Index("ix_chat_messages_session_created", "session_id", "created_at"),)
+
@@ -1,7 +1,8 @@
 """User model."""
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, DateTime
 from sqlalchemy.sql import func
 from app.database.connection import Base
+from app.database.types import UUIDColumn
 import uuid
 
 
@@ -9,7 +10,7 @@ class User(Base):
     """User model."""
     __tablename__ = "users"
     
-    user_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(UUIDColumn, primary_key=True, default=lambda: str(uuid.uuid4()))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -1,13 +1,26 @@
 """Authentication routes."""
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from app.database.connection import get_db
 from app.models.user import User
+from app.utils.validators import validate_uuid
 from pydantic import BaseModel
+from typing import Optional
 import uuid
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
+# Built once; a Core insert skips ORM unit-of-work bookkeeping on signin.
+# Where supported, an existing user_id is left untouched in the same round trip.
+_insert_user = insert(User)
+_upsert_user_by_dialect = {
+    "sqlite": sqlite_insert(User).on_conflict_do_nothing(index_elements=["user_id"]),
+    "postgresql": postgresql_insert(User).on_conflict_do_nothing(index_elements=["user_id"]),
+}
+
 
 class SignInResponse(BaseModel):
     """Sign in response model."""
@@ -15,25 +28,29 @@ class SignInResponse(BaseModel):
 
 
 @router.post("/signin", response_model=SignInResponse)
-async def signin(db: Session = Depends(get_db)):
+def signin(user_id: Optional[str] = None, db: Session = Depends(get_db)):
     """Sign in or create new user."""
-    # For simplicity, create a new user each time
+    # For simplicity, an unknown or missing user_id creates the user
     # In production, you'd want proper authentication
-    user_id = str(uuid.uuid4())
+    if user_id:
+        user_id = validate_uuid(user_id, "user ID")
+    else:
+        user_id = str(uuid.uuid4())
     
-    # Check if user exists (optional - for this implementation we create new)
-    user = User(user_id=user_id)
-    db.add(user)
+    # Insert the user unless it already exists
+    stmt = _upsert_user_by_dialect.get(db.get_bind().dialect.name, _insert_user)
+    db.execute(stmt, {"user_id": user_id})
     db.commit()
-    db.refresh(user)
     
     return SignInResponse(user_id=user_id)
 
 
 @router.get("/me")
-async def get_current_user(user_id: str, db: Session = Depends(get_db)):
+def get_current_user(user_id: str, db: Session = Depends(get_db)):
     """Get current user information."""
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user_id = validate_uuid(user_id, "user ID")
+    # Only two columns are returned, so fetch a plain row rather than a full entity
+    user = db.execute(select(User.user_id, User.created_at).where(User.user_id == user_id)).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {"user_id": user.user_id, "created_at": user.created_at}
@@ -1,13 +1,35 @@
 """Catalog routes."""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import bindparam, lambda_stmt, select
 from sqlalchemy.orm import Session
 from app.database.connection import get_db
 from app.models.catalog import Catalog, File as FileModel
+from app.utils.validators import validate_uuid
 from pydantic import BaseModel
 from typing import List
+import hashlib
 
 router = APIRouter(prefix="/api/catalog", tags=["catalog"])
 
+# Cached statement for the per-file catalog lookup
+_select_catalog_by_file = lambda_stmt(lambda: select(Catalog).where(Catalog.file_id == bindparam("file_id")))
+
+# Clients may reuse a response only after revalidating its ETag
+CATALOG_CACHE_CONTROL = "private, no-cache"
+
+
+def _make_etag(*parts: str) -> str:
+    """Build a strong ETag from the given parts."""
+    return '"' + hashlib.blake2b("|".join(parts).encode(), digest_size=8).hexdigest() + '"'
+
+
+def _is_not_modified(request: Request, etag: str) -> bool:
+    """Check whether the client's If-None-Match header matches the ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
 
 class CatalogSummary(BaseModel):
     """Catalog summary model."""
@@ -21,45 +43,43 @@ class CatalogListResponse(BaseModel):
 
 
 @router.get("/{user_id}", response_model=List[CatalogSummary])
-async def get_user_catalogs(user_id: str, db: Session = Depends(get_db)):
+def get_user_catalogs(user_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
     """Retrieve all catalogs for a user."""
-    # Get all files for user
-    files = db.query(FileModel).filter(FileModel.user_id == user_id).all()
+    user_id = validate_uuid(user_id, "user ID")
+    # Join files to catalogs in a single query instead of fetching each separately
+    rows = db.execute(
+        select(FileModel.file_id, Catalog.summary, Catalog.catalog_id)
+        .join(Catalog, Catalog.file_id == FileModel.file_id)
+        .where(FileModel.user_id == user_id)
+    ).all()
     
-    if not files:
-        return []
+    # Catalogs are never edited in place; a re-generated catalog gets a new catalog_id
+    etag = _make_etag(*(catalog_id for _, _, catalog_id in rows))
+    if _is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
     
-    # Get catalogs for these files
-    file_ids = [f.file_id for f in files]
-    catalogs = db.query(Catalog).filter(Catalog.file_id.in_(file_ids)).all()
-    
-    # Create catalog map
-    catalog_map = {cat.file_id: cat for cat in catalogs}
-    
-    # Build response
-    result = []
-    for file in files:
-        catalog = catalog_map.get(file.file_id)
-        if catalog:
-            result.append(CatalogSummary(
-                file_id=file.file_id,
-                summary=catalog.summary
-            ))
-    
-    return result
+    # Plain dicts: response_model validates them once on the way out
+    return [{"file_id": file_id, "summary": summary} for file_id, summary, _ in rows]
 
 
 @router.get("/file/{file_id}")
-async def get_file_catalog(file_id: str, db: Session = Depends(get_db)):
+def get_file_catalog(file_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get specific catalog for a file."""
-    catalog = db.query(Catalog).filter(Catalog.file_id == file_id).first()
+    catalog = db.execute(_select_catalog_by_file, {"file_id": file_id}).scalar_one_or_none()
     if not catalog:
         raise HTTPException(status_code=404, detail="Catalog not found")
     
+    etag = _make_etag(catalog.catalog_id)
+    if _is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
+    
     return {
         "file_id": catalog.file_id,
         "summary": catalog.summary,
         "metadata": catalog.metadata_json,
         "created_at": catalog.created_at
     }
-
@@ -1,17 +1,22 @@
 """Chat routes."""
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, exists, select
+from sqlalchemy.orm import Session, load_only, selectinload
 from app.database.connection import get_db
 from app.models.chat import ChatSession, ChatMessage
 from app.models.catalog import Catalog, File as FileModel
-from app.services.gemini_service import gemini_service
+from app.services.gemini_service import gemini_service, SQL_PROMPT_HISTORY_MESSAGES
 from app.services.sql_executor import sql_executor
 from app.services.statistics_analyzer import statistics_analyzer
 from app.services.data_editor import data_editor
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from app.utils.validators import validate_uuid
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional, Dict, Any, FrozenSet, Tuple
+from collections import Counter
+from functools import cached_property, lru_cache
 import re
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +27,8 @@ router = APIRouter(prefix="/api/chat", tags=["chat"])
 class ChatMessageRequest(BaseModel):
     """Chat message request."""
 
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     user_id: str
     message: str
     session_id: Optional[str] = None
@@ -30,6 +37,8 @@ class ChatMessageRequest(BaseModel):
 class VisualizationConfig(BaseModel):
     """Visualization configuration."""
 
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     type: str  # bar_chart, line_chart, kpi, table, insights
     show_bar_chart: bool = False
     input_data: Optional[List[Dict[str, Any]]] = None
@@ -38,245 +47,460 @@ class VisualizationConfig(BaseModel):
 class ChatMessageResponse(BaseModel):
     """Chat message response."""
 
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     message: str
     data: Optional[Dict[str, Any]] = None
     visualization: Optional[VisualizationConfig] = None
     session_id: str
 
 
-def is_small_talk(message: str) -> bool:
+def _any_of(*patterns: str) -> re.Pattern:
+    """Fuse patterns into one alternation so a message is scanned in a single pass."""
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+
+_SMALL_TALK = "small_talk"
+_EDIT_CAPABILITY = "edit_capability"
+_EDIT_VERBS = {verb: _EDIT_CAPABILITY for verb in ("edit", "modify", "change", "update")}
+
+# Token trie over the opening words of a message; string leaves name the intent
+_PREFIX_TRIE = {
+    **{word: _SMALL_TALK for word in ("hi", "hello", "hey", "greetings", "thanks", "thx", "bye", "goodbye")},
+    "thank": {"you": _SMALL_TALK},
+    "see": {"you": _SMALL_TALK},
+    "how's": {"it": {"going": _SMALL_TALK}},
+    "hows": {"it": {"going": _SMALL_TALK}},
+    "how": {
+        "are": {"you": _SMALL_TALK},
+        "do": {"i": _EDIT_VERBS},
+        "can": {"i": _EDIT_VERBS},
+    },
+    "can": {"i": {"edit": _EDIT_CAPABILITY}},
+    "is": {
+        "there": {"a": {"way": {"to": {"edit": _EDIT_CAPABILITY}}}},
+        "it": {"possible": {"to": _EDIT_VERBS}},
+    },
+}
+_PREFIX_MAX_TOKENS = 6
+
+
+def classify_prefix(message_lower: str) -> Optional[str]:
+    """Walk the opening words of a message through _PREFIX_TRIE and return the intent reached, if any."""
+    node = _PREFIX_TRIE
+    for token in message_lower.split(maxsplit=_PREFIX_MAX_TOKENS)[:_PREFIX_MAX_TOKENS]:
+        node = node.get(token.strip("!?.,"))
+        if node is None or isinstance(node, str):
+            return node
+    return None
+
+
+# Small talk anywhere in the message (the trie only covers the opening words)
+_SMALL_TALK_RE = _any_of(
+    r"\b(hi|hello|hey|greetings)\b",
+    r"\b(how are you|how\'?s it going)\b",
+    r"\b(thanks|thank you|thx)\b",
+    r"\b(bye|goodbye|see you)\b",
+)
+
+
+def is_small_talk(message_lower: str) -> bool:
     """Detect if message is small talk."""
-    small_talk_patterns = [
-        r"\b(hi|hello|hey|greetings)\b",
-        r"\b(how are you|how\'?s it going)\b",
-        r"\b(thanks|thank you|thx)\b",
-        r"\b(bye|goodbye|see you)\b",
-    ]
+    if classify_prefix(message_lower) == _SMALL_TALK:
+        return True
+    return _SMALL_TALK_RE.search(message_lower) is not None
 
-    message_lower = message.lower()
-    return any(re.search(pattern, message_lower) for pattern in small_talk_patterns)
 
+# Explicit keywords for anomaly/outlier detection and stats/analysis requests
+_ANOMALY_KEYWORDS = r"anomal|outlier|unusual|abnormal|exception"
+_STATS_KEYWORDS = r"statistic|stats|analyze|analysis|insight"
 
-def is_stats_request(message: str) -> bool:
+# Pattern-based detection (more specific)
+_STATS_PATTERNS = (
+    r"\b(show|find|detect|identify|list|display)\s+(anomal|outlier|unusual)",
+    r"\b(distribution|variance|std dev|standard deviation)\b",
+    r"\b(trend(s)?|pattern(s)?)\b",
+    r"\b(summarize|summary)\b",
+    r"\b(data quality|missing values?)\b",
+    r"\b(correlation(s)?)\b",
+    r"\b(show me (the )?(stats|statistics|insights))\b",
+)
+
+# All three checks in one scan; the named group that matched says which kind of hit it was
+_STATS_REQUEST_RE = re.compile(
+    rf"(?P<anomaly>{_ANOMALY_KEYWORDS})|(?P<keyword>{_STATS_KEYWORDS})|(?P<pattern>{_any_of(*_STATS_PATTERNS).pattern})"
+)
+
+
+def is_stats_request(message_lower: str) -> bool:
     """Detect if user wants statistical analysis or insights."""
-    message_lower = message.lower().strip()
-    
-    # Explicit patterns for anomaly/outlier detection
-    anomaly_keywords = ["anomal", "outlier", "unusual", "abnormal", "exception"]
-    stats_keywords = ["statistics", "stats", "statistical", "analyze", "analysis", "insights", "insight"]
+    message_lower = message_lower.strip()
+    match = _STATS_REQUEST_RE.search(message_lower)
+    if match is None:
+        return False
     
-    # Check for anomaly-related requests
-    if any(keyword in message_lower for keyword in anomaly_keywords):
+    if match.lastgroup == "anomaly":
         logger.info(f"Detected anomaly keyword in: {message_lower}")
-        return True
-    
-    # Check for stats/analysis requests
-    if any(keyword in message_lower for keyword in stats_keywords):
+    elif match.lastgroup == "keyword":
         logger.info(f"Detected stats keyword in: {message_lower}")
-        return True
-    
-    # Pattern-based detection (more specific)
-    stats_patterns = [
-        r"\b(show|find|detect|identify|list|display)\s+(anomal|outlier|unusual)",
-        r"\b(distribution|variance|std dev|standard deviation)\b",
-        r"\b(trend(s)?|pattern(s)?)\b",
-        r"\b(summarize|summary)\b",
-        r"\b(data quality|missing values?)\b",
-        r"\b(correlation(s)?)\b",
-        r"\b(show me (the )?(stats|statistics|insights))\b",
-    ]
-    
-    for pattern in stats_patterns:
-        if re.search(pattern, message_lower):
-            logger.info(f"Matched stats pattern '{pattern}' for: {message_lower}")
-            return True
-    
-    return False
+    else:
+        logger.info(f"Matched stats pattern '{match.group(0)}' for: {message_lower}")
+    return True
 
 
-def is_edit_capability_question(message: str) -> bool:
+def is_edit_capability_question(message_lower: str) -> bool:
     """Detect if user is asking about edit capabilities."""
-    capability_patterns = [
-        r"^can\s+i\s+edit",
-        r"^is\s+there\s+a\s+way\s+to\s+edit",
-        r"^how\s+(do|can)\s+i\s+(edit|modify|change|update)",
-        r"^is\s+it\s+possible\s+to\s+(edit|modify|change|update)",
-    ]
-    message_lower = message.lower().strip()
-    return any(re.search(pattern, message_lower) for pattern in capability_patterns)
+    return classify_prefix(message_lower) == _EDIT_CAPABILITY
+
+
+# Only detect color customization requests here
+# Chart type change requests are handled by checking for chart type keywords in the main flow
+_COLOR_RE = _any_of(
+    r"\b(change|modify|update|set|make)\s+(the\s+)?(color|colour|colours|colors)",
+    r"\b(color|colour|colours|colors)\s+(of|for)\s+(the\s+)?(chart|graph|bar|line)",
+    r"\b(change|switch|make)\s+(it|the\s+chart|the\s+graph)\s+(to\s+)?(different\s+)?(color|colour|colours|colors)",
+)
 
 
-def is_visualization_customization_request(message: str) -> bool:
+def is_visualization_customization_request(message_lower: str) -> bool:
     """Detect if user is asking to customize visualization (colors only - chart type changes are handled separately)."""
-    # Only detect color customization requests here
-    # Chart type change requests are handled by checking for chart type keywords in the main flow
-    color_customization_patterns = [
-        r"\b(change|modify|update|set|make)\s+(the\s+)?(color|colour|colours|colors)",
-        r"\b(color|colour|colours|colors)\s+(of|for)\s+(the\s+)?(chart|graph|bar|line)",
-        r"\b(change|switch|make)\s+(it|the\s+chart|the\s+graph)\s+(to\s+)?(different\s+)?(color|colour|colours|colors)",
-    ]
-    message_lower = message.lower().strip()
-    return any(re.search(pattern, message_lower) for pattern in color_customization_patterns)
+    message_lower = message_lower.strip()
+    return _COLOR_RE.search(message_lower) is not None
+
 
+_CHART_TYPE_RE = _any_of(
+    r"\b(show|see|display|view)\s+(the\s+)?(data|it|this|that)\s+(in|as|with)\s+(a\s+)?(different\s+)?(chart|graph|table)",
+    r"\b(show|see|display|view)\s+(it|this|that|the\s+data)\s+as\s+(a\s+)?(bar|line|table)",
+    r"\b(chart\s+type|graph\s+type|visualization\s+type)",
+    r"\b(bar\s+chart|line\s+chart|pie\s+chart|table)\s+(instead|please|now)",
+    r"\b(change|switch|convert)\s+(to|into)\s+(a\s+)?(bar\s+chart|line\s+chart|table)",
+    r"\b(different\s+)?(chart|graph|visualization)\s+type",
+)
 
-def is_chart_type_change_request(message: str) -> bool:
+
+def is_chart_type_change_request(message_lower: str) -> bool:
     """Detect if user wants to see data in a different chart type."""
-    chart_type_patterns = [
-        r"\b(show|see|display|view)\s+(the\s+)?(data|it|this|that)\s+(in|as|with)\s+(a\s+)?(different\s+)?(chart|graph|table)",
-        r"\b(show|see|display|view)\s+(it|this|that|the\s+data)\s+as\s+(a\s+)?(bar|line|table)",
-        r"\b(chart\s+type|graph\s+type|visualization\s+type)",
-        r"\b(bar\s+chart|line\s+chart|pie\s+chart|table)\s+(instead|please|now)",
-        r"\b(change|switch|convert)\s+(to|into)\s+(a\s+)?(bar\s+chart|line\s+chart|table)",
-        r"\b(different\s+)?(chart|graph|visualization)\s+type",
-    ]
-    message_lower = message.lower().strip()
-    return any(re.search(pattern, message_lower) for pattern in chart_type_patterns)
+    message_lower = message_lower.strip()
+    return _CHART_TYPE_RE.search(message_lower) is not None
+
+
+_EDIT_RE = _any_of(
+    r"\b(increase|decrease|raise|lower|reduce)\b.*\bby\b",
+    r"\b(set|assign)\s+.*\s+to\s+",
+    r"\b(add|insert|create)\s+(a\s+)?(new\s+)?row",
+    r"\b(delete|remove)\s+(row|data|entry)",
+    r"\b(double|triple|halve)\b.*\b(the|all)\b",
+    r"\b(multiply|divide)\b.*\bby\b",
+    r"(update|change|modify)\s+.*\s+(to|=)\s+",
+)
 
 
-def is_edit_request(message: str) -> bool:
+def is_edit_request(message_lower: str) -> bool:
     """Detect if user wants to edit/update/modify data."""
     # First check if it's just a question about capabilities
-    if is_edit_capability_question(message):
+    if is_edit_capability_question(message_lower):
         return False
 
-    edit_patterns = [
-        r"\b(increase|decrease|raise|lower|reduce)\b.*\bby\b",
-        r"\b(set|assign)\s+.*\s+to\s+",
-        r"\b(add|insert|create)\s+(a\s+)?(new\s+)?row",
-        r"\b(delete|remove)\s+(row|data|entry)",
-        r"\b(double|triple|halve)\b.*\b(the|all)\b",
-        r"\b(multiply|divide)\b.*\bby\b",
-        r"(update|change|modify)\s+.*\s+(to|=)\s+",
-    ]
-
-    message_lower = message.lower()
-    return any(re.search(pattern, message_lower) for pattern in edit_patterns)
-
-
-def is_file_metadata_question(question: str) -> bool:
+    return _EDIT_RE.search(message_lower) is not None
+
+
+# Exclude queries that are clearly about data content, not file metadata
+# These patterns indicate the user wants to query the data, not get file description
+_DATA_QUERY_INDICATOR_RE = _any_of(
+    r"what.*are.*(the|under|in)",
+    r"list.*(the|all|all the)",
+    r"show.*(me|the|all)",
+    r"count.*of",
+    r"how.*many",
+    r"select.*from",
+    r"get.*(the|all)",
+)
+
+_METADATA_RE = _any_of(
+    r"^what.*file$",  # "what file" (standalone)
+    r"^tell.*about.*file$",  # "tell about file" (standalone)
+    r"file.*about$",  # "file about" (at end)
+    r"describe.*file",
+    r"tell.*about.*file",
+    r"tell.*about.*(the\s+)?data$",  # "tell about the data" (at end, not "what are under data")
+    r"^what.*dataset$",  # "what dataset" (standalone)
+    r"^what.*data$",  # "what data" (standalone, not "what are the data")
+    r"explain.*file",
+    r"file.*description",
+    r"^what.*in.*file$",  # "what in file" (standalone)
+    r"file.*contains$",
+    r"tell.*me.*about.*(the\s+)?file",
+    r"can.*you.*tell.*about.*file",
+    r"describe.*(the\s+)?file",
+    r"explain.*(the\s+)?file",
+)
+
+
+def is_file_metadata_question(question_lower: str) -> bool:
     """Detect if user is asking about file metadata/description."""
-    question_lower = question.lower().strip()
-    
-    # Exclude queries that are clearly about data content, not file metadata
-    # These patterns indicate the user wants to query the data, not get file description
-    data_query_indicators = [
-        r"what.*are.*(the|under|in)",
-        r"list.*(the|all|all the)",
-        r"show.*(me|the|all)",
-        r"count.*of",
-        r"how.*many",
-        r"select.*from",
-        r"get.*(the|all)",
-    ]
+    question_lower = question_lower.strip()
     
     # If the question contains data query indicators, it's NOT a metadata question
-    for pattern in data_query_indicators:
-        if re.search(pattern, question_lower):
-            return False
+    if _DATA_QUERY_INDICATOR_RE.search(question_lower):
+        return False
     
-    metadata_patterns = [
-        r"^what.*file$",  # "what file" (standalone)
-        r"^tell.*about.*file$",  # "tell about file" (standalone)
-        r"file.*about$",  # "file about" (at end)
-        r"describe.*file",
-        r"tell.*about.*file",
-        r"tell.*about.*(the\s+)?data$",  # "tell about the data" (at end, not "what are under data")
-        r"^what.*dataset$",  # "what dataset" (standalone)
-        r"^what.*data$",  # "what data" (standalone, not "what are the data")
-        r"explain.*file",
-        r"file.*description",
-        r"^what.*in.*file$",  # "what in file" (standalone)
-        r"file.*contains$",
-        r"tell.*me.*about.*(the\s+)?file",
-        r"can.*you.*tell.*about.*file",
-        r"describe.*(the\s+)?file",
-        r"explain.*(the\s+)?file",
-    ]
-    return any(re.search(pattern, question_lower) for pattern in metadata_patterns)
+    return _METADATA_RE.search(question_lower) is not None
+
+
+# Common words that don't help with file selection
+_STOP_WORDS = frozenset({'show', 'the', 'last', 'first', 'rows', 'row', 'data', 'me', 'can', 'you', 'get', 'give', 'tell', 'what', 'is', 'are', 'in', 'of', 'with', 'count', 'how', 'many', 'from', 'select', 'all', 'display', 'list'})
+# Word tokens of 3+ characters; shorter words never helped file selection
+_KEYWORD_RE = re.compile(r"[a-z0-9]{3,}")
+
+
+def _keyword_tokens(text_lower: str) -> FrozenSet[str]:
+    """Split lowercased text into the keywords used for file matching."""
+    return frozenset(_KEYWORD_RE.findall(text_lower)).difference(_STOP_WORDS)
+
+
+@lru_cache(maxsize=256)
+def _summary_tokens(summary: str) -> FrozenSet[str]:
+    """Keyword set of a catalog summary, cached by summary text so edits invalidate it."""
+    return _keyword_tokens(summary.lower())
+
+
+@lru_cache(maxsize=128)
+def _catalog_keyword_index(entries: Tuple[Tuple[str, str], ...]) -> Dict[str, Tuple[str, ...]]:
+    """Inverted keyword -> file_ids index over (file_id, summary) pairs; any catalog change is a new cache key."""
+    index: Dict[str, List[str]] = {}
+    for file_id, summary in entries:
+        for token in _summary_tokens(summary):
+            index.setdefault(token, []).append(file_id)
+    return {token: tuple(file_ids) for token, file_ids in index.items()}
+
+
+# File references: "file 2"/"file2", a bare "2" (reply to the which-file prompt), or "second file"
+_FILE_SELECTOR_RE = re.compile(
+    r"file\s*(?P<num>\d+)|^(?P<justnum>\d+)$|(?P<ordinal>first|second|third|fourth|fifth)\s*file"
+)
+_ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5}
+
+
+def parse_file_number(message_lower: str, file_count: int) -> Optional[int]:
+    """1-indexed file number a message refers to ("file 2", "file2", a bare "2", "second file"), if in range."""
+    for match in _FILE_SELECTOR_RE.finditer(message_lower.strip()):
+        if match.lastgroup == "ordinal":
+            file_num = _ORDINALS[match.group("ordinal")]
+        else:
+            file_num = int(match.group(match.lastgroup))
+        if 1 <= file_num <= file_count:
+            return file_num
+    return None
+
+
+class MessageIntents:
+    """Detector results for one chat message, each computed on first use.
+
+    send_message checks intents in a fixed order and returns on the first hit,
+    so detectors for later branches never run on messages an earlier branch handles.
+    """
+
+    def __init__(self, message: str):
+        self.lower = message.lower()
+
+    @cached_property
+    def metadata(self) -> bool:
+        return is_file_metadata_question(self.lower)
+
+    @cached_property
+    def small_talk(self) -> bool:
+        return is_small_talk(self.lower)
+
+    @cached_property
+    def chart_change(self) -> bool:
+        return is_chart_type_change_request(self.lower)
+
+    @cached_property
+    def viz_color(self) -> bool:
+        return is_visualization_customization_request(self.lower)
+
+    @cached_property
+    def edit_capability(self) -> bool:
+        return is_edit_capability_question(self.lower)
+
+    @cached_property
+    def edit(self) -> bool:
+        return not self.edit_capability and is_edit_request(self.lower)
+
+    @cached_property
+    def stats(self) -> bool:
+        return is_stats_request(self.lower)
+
+
+def classify_message(message: str) -> MessageIntents:
+    """Lowercase the message once; intent detectors run lazily on it."""
+    return MessageIntents(message)
+
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+
+# Small-talk replies are reused for up to this many distinct normalized messages
+SMALL_TALK_CACHE_SIZE = 256
+# normalized message -> Gemini reply; shared by all threadpool handlers
+_small_talk_cache: Dict[str, str] = {}
+_small_talk_cache_lock = threading.Lock()
+
+
+def small_talk_reply(message: str) -> str:
+    """Reply to small talk, reusing the answer for greetings seen before.
+
+    The cache is deliberately process-wide and shared across users and sessions: small talk
+    carries no user data, and a greeting gets the same kind of reply whoever sends it.
+    Gemini sees the raw message; the normalized form is only the cache key.
+    """
+    # Punctuation, case and spacing don't change a greeting ("Hi!" == "hi")
+    normalized = " ".join(_NON_WORD_RE.sub(" ", message.lower()).split())
+    with _small_talk_cache_lock:
+        cached = _small_talk_cache.get(normalized)
+    if cached is not None:
+        return cached
+
+    reply = gemini_service.chat_completion(messages=[{"role": "user", "content": message}], use_tools=False)
+    with _small_talk_cache_lock:
+        if len(_small_talk_cache) >= SMALL_TALK_CACHE_SIZE:
+            _small_talk_cache.pop(next(iter(_small_talk_cache)), None)
+        _small_talk_cache[normalized] = reply
+    return reply
+
+
+def load_user_files(db: Session, user_id: str) -> List[Row]:
+    """Return (file_id, original_filename, summary) for each of a user's files in one query."""
+    # Outer join so a file whose catalog is missing still counts (summary is None)
+    return db.execute(
+        select(FileModel.file_id, FileModel.original_filename, Catalog.summary)
+        .outerjoin(Catalog, Catalog.file_id == FileModel.file_id)
+        .where(FileModel.user_id == user_id)
+    ).all()
 
 
-def select_relevant_file(question: str, catalogs: List[Dict[str, str]], db: Session = None) -> Optional[str]:
-    """Select most relevant file based on question and catalogs."""
+def load_recent_messages(db: Session, session_id: str, limit: int = 10) -> List[ChatMessage]:
+    """Return a session's last messages, most recent first."""
+    # Only role, content and sql_query are read from history, so the tool_calls JSON is never decoded
+    return (
+        db.query(ChatMessage)
+        .options(load_only(ChatMessage.role, ChatMessage.content, ChatMessage.sql_query, raiseload=True))
+        .filter(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+# Openings of the "which file" prompts send_message asks when a request is ambiguous
+_FILE_PROMPT_RE = re.compile(r"Which file would you like to (?:know about|query|analyze)")
+
+
+def _is_file_prompt(content: str) -> bool:
+    """Whether an assistant message asked the user to pick a file."""
+    return _FILE_PROMPT_RE.search(content) is not None
+
+
+# Chat responses carry at most this many rows; larger results are cut off and flagged
+MAX_RESPONSE_ROWS = 500
+
+
+def run_capped_query(table_name: str, sql_query: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """Execute a query returning at most MAX_RESPONSE_ROWS rows, plus whether more existed."""
+    rows = sql_executor.execute_query(table_name, sql_query, max_rows=MAX_RESPONSE_ROWS + 1)
+    if len(rows) > MAX_RESPONSE_ROWS:
+        return rows[:MAX_RESPONSE_ROWS], True
+    return rows, False
+
+
+def _result_count_text(rows: List[Dict[str, Any]], truncated: bool) -> str:
+    """Result count for the reply text, e.g. "3 result(s)" or "more than 500 results (showing the first 500)"."""
+    if truncated:
+        return f"more than {MAX_RESPONSE_ROWS} results (showing the first {MAX_RESPONSE_ROWS})"
+    return f"{len(rows)} result(s)"
+
+
+def select_relevant_file(
+    question: str,
+    catalogs: List[Dict[str, str]],
+    db: Session = None,
+    *,
+    intents: Optional[MessageIntents] = None
+) -> Optional[str]:
+    """Select most relevant file based on question and catalogs (reusing the request's intents if given)."""
     if not catalogs:
         return None
 
     if len(catalogs) == 1:
         return catalogs[0]["file_id"]
 
-    # Check if it's a file metadata question with no specific file mentioned
-    is_metadata_q = is_file_metadata_question(question)
-    question_lower = question.lower()
-    
-    # Check if user mentioned a specific file number (file 1, file 2, file2, first file, etc.)
-    # Match patterns like: "file 1", "file1", "file2", "file 2", etc.
-    file_number_match = re.search(r"file\s*(\d+)", question_lower)
-    if file_number_match:
-        file_num = int(file_number_match.group(1))
-        # File numbers are 1-indexed, convert to 0-indexed
-        if 1 <= file_num <= len(catalogs):
-            logger.info(f"Matched file number {file_num} from question: {question}")
-            return catalogs[file_num - 1]["file_id"]
-    
-    # Also check for just a number (e.g., "2" after "which file" prompt)
-    # This handles cases where user just types "2" or "file2" without space
-    # But only if the question is very short (likely a file selection response)
-    if len(question_lower.strip()) <= 10:  # Short response like "file2", "2", "file 2"
-        # Try to extract just a number
-        just_number_match = re.search(r"^(\d+)$", question_lower.strip())
-        if just_number_match:
-            file_num = int(just_number_match.group(1))
-            if 1 <= file_num <= len(catalogs):
-                logger.info(f"Matched file number {file_num} from short response: {question}")
-                return catalogs[file_num - 1]["file_id"]
-    
-    # Check for ordinal mentions (first, second, third file)
-    if re.search(r"first\s*file", question_lower) and len(catalogs) >= 1:
-        return catalogs[0]["file_id"]
-    if re.search(r"second\s*file", question_lower) and len(catalogs) >= 2:
-        return catalogs[1]["file_id"]
-    if re.search(r"third\s*file", question_lower) and len(catalogs) >= 3:
-        return catalogs[2]["file_id"]
+    if intents is None:
+        intents = classify_message(question)
+    entries = tuple((cat["file_id"], cat["summary"]) for cat in catalogs)
+    return _select_file(intents.lower, intents.metadata, entries)
+
+
+def _select_file(question_lower: str, is_metadata_q: bool, entries: Tuple[Tuple[str, str], ...]) -> Optional[str]:
+    """File choice for a lowercased question over (file_id, summary) entries."""
+    # Check if user mentioned a specific file (file 1, file2, a bare "2", first file, etc.)
+    # File numbers are 1-indexed; out-of-range references are skipped
+    file_num = parse_file_number(question_lower, len(entries))
+    if file_num:
+        logger.info(f"Matched file number {file_num} from question: {question_lower}")
+        return entries[file_num - 1][0]
     
     # Check if file_id is directly mentioned
-    for catalog in catalogs:
-        if catalog["file_id"].lower() in question_lower:
-            return catalog["file_id"]
+    for file_id, _ in entries:
+        if file_id.lower() in question_lower:
+            return file_id
     
     # If metadata question and no specific file mentioned, return None to trigger file list
-    if is_metadata_q and len(catalogs) > 1:
+    if is_metadata_q:
         return None  # Signal that we need to ask which file
 
-    # For data queries: Try keyword matching, but if no strong match and multiple files exist,
-    # return None to ask user which file (don't default to first file)
-    keywords = question_lower.split()
-    # Filter out common words that don't help with file selection
-    stop_words = {'show', 'the', 'last', 'first', 'rows', 'row', 'data', 'me', 'can', 'you', 'get', 'give', 'tell', 'what', 'is', 'are', 'in', 'of', 'with', 'count', 'how', 'many', 'from', 'select', 'all', 'display', 'list'}
-    meaningful_keywords = [kw for kw in keywords if kw not in stop_words and len(kw) > 2]
+    # For data queries: Try keyword matching, but if no strong match, return None to ask
+    # user which file (don't default to first file)
+    # Only count meaningful keywords that actually help identify the file
+    keyword_index = _catalog_keyword_index(entries)
+    scores = Counter()
+    for keyword in _keyword_tokens(question_lower):
+        scores.update(keyword_index.get(keyword, ()))
 
     best_match = None
     best_score = 0
 
-    for catalog in catalogs:
-        summary_lower = catalog["summary"].lower()
-        # Only count meaningful keywords that actually help identify the file
-        score = sum(1 for keyword in meaningful_keywords if keyword in summary_lower)
+    for file_id, _ in entries:
+        score = scores[file_id]
         if score > best_score:
             best_score = score
-            best_match = catalog["file_id"]
+            best_match = file_id
 
     # If we have a strong match (multiple meaningful keywords), use it
     if best_score >= 2:
         logger.info(f"Selected file based on strong keyword match (score: {best_score})")
         return best_match
     
-    # If no strong match and multiple files exist, ask user which file
+    # If no strong match, ask user which file
     # This prevents defaulting to first file for ambiguous queries like "show last 5 rows"
-    if len(catalogs) > 1:
-        logger.info(f"Ambiguous query with {len(catalogs)} files. No strong match (score: {best_score}). Returning None to ask user.")
-        return None  # Ask user which file
-    
-    # If only one file, return it (even with weak/no match)
-    return catalogs[0]["file_id"]
+    logger.info(f"Ambiguous query with {len(entries)} files. No strong match (score: {best_score}). Returning None to ask user.")
+    return None  # Ask user which file
+
+
+# Chart preference keywords, matched against the 1- to 3-word phrases of a message
+_TABLE_KEYWORDS = frozenset({"table", "row and column", "rows and columns", "list", "show as table", "as table", "in table format"})
+_LINE_CHART_KEYWORDS = frozenset({"line chart", "line graph", "linechart", "linegraph", "line"})
+_BAR_CHART_KEYWORDS = frozenset({"bar chart", "bar graph", "barchart", "bargraph", "bars"})
+_CHART_KEYWORDS = frozenset({"chart", "graph", "visualize", "pie chart", "show chart", "show graph"})
+_SPECIFIC_CHART_KEYWORDS = frozenset({"bar chart", "line chart", "table", "bar graph", "line graph", "bars", "line"})
+_DATE_COLUMN_RE = re.compile(r"date|time|day|month|year|period")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _message_phrases(message_lower: str) -> FrozenSet[str]:
+    """All 1- to 3-word phrases of a lowercased message, for keyword set lookups."""
+    words = _WORD_RE.findall(message_lower)
+    return frozenset(
+        " ".join(words[i:i + n]) for n in (1, 2, 3) for i in range(len(words) - n + 1)
+    )
 
 
 def determine_visualization(rows: List[Dict[str, Any]], columns: List[str], user_message: Optional[str] = None) -> Optional[VisualizationConfig]:
@@ -287,15 +511,11 @@ def determine_visualization(rows: List[Dict[str, Any]], columns: List[str], user
     user_message_lower = (user_message or "").lower()
 
     # Check for explicit user preferences
-    table_keywords = ["table", "row and column", "rows and columns", "list", "show as table", "as table", "in table format"]
-    line_chart_keywords = ["line chart", "line graph", "linechart", "linegraph", "line"]
-    bar_chart_keywords = ["bar chart", "bar graph", "barchart", "bargraph", "bars"]
-    chart_keywords = ["chart", "graph", "visualize", "pie chart", "show chart", "show graph"]
-    
-    wants_table = any(keyword in user_message_lower for keyword in table_keywords)
-    wants_line_chart = any(keyword in user_message_lower for keyword in line_chart_keywords)
-    wants_bar_chart = any(keyword in user_message_lower for keyword in bar_chart_keywords)
-    wants_chart = any(keyword in user_message_lower for keyword in chart_keywords)
+    phrases = _message_phrases(user_message_lower)
+    wants_table = not _TABLE_KEYWORDS.isdisjoint(phrases)
+    wants_line_chart = not _LINE_CHART_KEYWORDS.isdisjoint(phrases)
+    wants_bar_chart = not _BAR_CHART_KEYWORDS.isdisjoint(phrases)
+    wants_chart = not _CHART_KEYWORDS.isdisjoint(phrases)
 
     # Single value - KPI (unless user wants table)
     if len(rows) == 1 and len(columns) == 1:
@@ -312,7 +532,7 @@ def determine_visualization(rows: List[Dict[str, Any]], columns: List[str], user
     date_columns = [
         col
         for col in columns
-        if any(keyword in col.lower() for keyword in ["date", "time", "day", "month", "year", "period"])
+        if _DATE_COLUMN_RE.search(col.lower())
     ]
     if date_columns and len(columns) == 2 and len(rows) > 1:
         # Line chart for time series (unless user wants table)
@@ -346,115 +566,103 @@ def determine_visualization(rows: List[Dict[str, Any]], columns: List[str], user
 
 
 @router.post("/message", response_model=ChatMessageResponse)
-async def send_message(request: ChatMessageRequest, db: Session = Depends(get_db)):
+def send_message(request: ChatMessageRequest, db: Session = Depends(get_db)):
     """Send a chat message and get response."""
+    # Reject malformed IDs before they reach the uuid columns
+    request = request.model_copy(update={
+        "user_id": validate_uuid(request.user_id, "user ID"),
+        "session_id": validate_uuid(request.session_id, "session ID") if request.session_id else None,
+    })
+    response = answer_message(request, db)
+    # The assistant reply commits on its own, after the Gemini call and any data edit
+    db.commit()
+    return response
+
+
+def answer_message(request: ChatMessageRequest, db: Session) -> ChatMessageResponse:
+    """Build the reply to a chat message; the assistant reply is left pending for the caller to commit."""
     logger.info(f"Received message from user {request.user_id}: {request.message}")
 
-    # Get or create session
+    # Get or create session (an existing session only needs an EXISTS check, not a load)
     if request.session_id:
-        session = db.query(ChatSession).filter(ChatSession.session_id == request.session_id).first()
-        if not session:
+        session_id = request.session_id
+        if not db.scalar(select(exists().where(ChatSession.session_id == session_id))):
             raise HTTPException(status_code=404, detail="Session not found")
     else:
         session = ChatSession(user_id=request.user_id)
         db.add(session)
-        db.commit()
-        db.refresh(session)
+        db.flush()  # Assigns session_id
+        session_id = session.session_id
 
-    # Save user message
-    user_message = ChatMessage(session_id=session.session_id, role="user", content=request.message)
+    # Save user message, committed with any new session before the reply is generated so no
+    # write lock is held through the Gemini call or the data edit (which writes on its own connection)
+    user_message = ChatMessage(session_id=session_id, role="user", content=request.message)
     db.add(user_message)
     db.commit()
 
-    # Check if file metadata question FIRST (before small talk check)
-    # This ensures queries about file data are handled properly
-    is_metadata_q = is_file_metadata_question(request.message)
+    # Classify the message once; the branches below reuse these flags
+    intents = classify_message(request.message)
     
     # Get files and catalogs early (needed for both metadata and data queries)
-    files = db.query(FileModel).filter(FileModel.user_id == request.user_id).all()
+    files = load_user_files(db, request.user_id)
     if not files:
         # No files - this might be small talk or a request for files
-        if is_small_talk(request.message):
+        if intents.small_talk:
             logger.info("Detected small talk, responding directly")
-            response_text = gemini_service.chat_completion(
-                messages=[{"role": "user", "content": request.message}], use_tools=False
-            )
-            assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+            response_text = small_talk_reply(request.message)
+            assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
             db.add(assistant_message)
-            db.commit()
-            return ChatMessageResponse(message=response_text, session_id=session.session_id)
+            return ChatMessageResponse(message=response_text, session_id=session_id)
         else:
             return ChatMessageResponse(
-                message="No data files found. Please upload a file first.", session_id=session.session_id
+                message="No data files found. Please upload a file first.", session_id=session_id
             )
     
-    file_ids = [f.file_id for f in files]
-    catalogs_query = db.query(Catalog).filter(Catalog.file_id.in_(file_ids)).all()
-    file_map = {f.file_id: f for f in files}
-    catalog_list = [
-        {
-            "file_id": cat.file_id,
-            "summary": cat.summary,
-            "original_filename": file_map[cat.file_id].original_filename if cat.file_id in file_map else cat.file_id
-        }
-        for cat in catalogs_query
-    ]
+    # Rows already carry file_id, original_filename and summary, so map them straight to dicts
+    catalog_list = [f._asdict() for f in files if f.summary is not None]
     
     # Check if small talk (but NOT metadata questions)
-    if is_small_talk(request.message) and not is_metadata_q:
+    # Metadata questions are never treated as small talk
+    if intents.small_talk and not intents.metadata:
         logger.info("Detected small talk, responding directly")
         # Direct response without tool calls
-        response_text = gemini_service.chat_completion(
-            messages=[{"role": "user", "content": request.message}], use_tools=False
-        )
+        response_text = small_talk_reply(request.message)
         logger.info(f"Small talk response: {response_text}")
 
         # Save assistant message
-        assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+        assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
         db.add(assistant_message)
-        db.commit()
 
-        return ChatMessageResponse(message=response_text, session_id=session.session_id)
-
-    # Get conversation history early (needed for chart type change detection)
-    previous_messages = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.session_id == session.session_id)
-        .order_by(ChatMessage.created_at.desc())
-        .limit(10)
-        .all()
-    )  # Last 10 messages (most recent first)
+        return ChatMessageResponse(message=response_text, session_id=session_id)
 
     # Check if user wants to change chart type for previous data
-    if is_chart_type_change_request(request.message):
+    if intents.chart_change:
         logger.info("Detected chart type change request")
-        # Find the last query that returned data
-        last_data_query = None
-        last_visualization_type = None
-        for msg in previous_messages:
-            if msg.role == "assistant" and msg.tool_calls:
-                tool_calls = msg.tool_calls
-                if isinstance(tool_calls, dict) and "sql_query" in tool_calls:
-                    last_data_query = tool_calls
-                    # Try to determine what visualization was used last time
-                    # Check if there's a visualization type in the response data
-                    break
+        # Find the last query that returned data (newest assistant message carrying a SQL query)
+        last_data_query = db.execute(
+            select(ChatMessage.sql_query, ChatMessage.sql_file_id)
+            .where(
+                ChatMessage.session_id == session_id,
+                ChatMessage.role == "assistant",
+                ChatMessage.sql_query.isnot(None),
+            )
+            .order_by(ChatMessage.created_at.desc())
+            .limit(1)
+        ).first()
         
-        if last_data_query and "sql_query" in last_data_query:
+        if last_data_query:
             # Re-execute the last query with new visualization type
-            sql_query = last_data_query["sql_query"]
-            table_name = last_data_query.get("file_id")
+            sql_query, table_name = last_data_query
             
             if table_name:
                 try:
                     logger.info(f"Re-executing previous query with different chart type: {sql_query}")
-                    rows = sql_executor.execute_query(table_name, sql_query)
+                    rows, truncated = run_capped_query(table_name, sql_query)
                     columns = list(rows[0].keys()) if rows else []
                     
                     # Determine visualization based on user's request
-                    user_msg_lower = request.message.lower()
-                    has_specific_chart_type = any(keyword in user_msg_lower for keyword in 
-                        ["bar chart", "line chart", "table", "bar graph", "line graph", "bars", "line"])
+                    user_msg_lower = intents.lower
+                    has_specific_chart_type = not _SPECIFIC_CHART_KEYWORDS.isdisjoint(_message_phrases(user_msg_lower))
                     
                     if not has_specific_chart_type and "different" in user_msg_lower:
                         # User wants a different chart type but didn't specify which one
@@ -483,23 +691,24 @@ async def send_message(request: ChatMessageRequest, db: Session = Depends(get_db
                     logger.info(f"New visualization type: {visualization.type if visualization else 'None'}")
                     
                     chart_type_name = visualization.type.replace('_', ' ') if visualization else "chart"
-                    response_text = f"I found {len(rows)} result(s). Showing in {chart_type_name} format."
+                    response_text = f"I found {_result_count_text(rows, truncated)}. Showing in {chart_type_name} format."
                     
                     # Save assistant message
                     assistant_message = ChatMessage(
-                        session_id=session.session_id,
+                        session_id=session_id,
                         role="assistant",
                         content=response_text,
                         tool_calls={"sql_query": sql_query, "file_id": table_name, "row_count": len(rows), "re_visualization": True},
+                        sql_query=sql_query,
+                        sql_file_id=table_name,
                     )
                     db.add(assistant_message)
-                    db.commit()
                     
                     # Prepare response
-                    response_data = {"rows": rows, "columns": columns, "sql_query": sql_query, "file_id": table_name}
+                    response_data = {"rows": rows, "columns": columns, "sql_query": sql_query, "file_id": table_name, "truncated": truncated}
                     
                     return ChatMessageResponse(
-                        message=response_text, data=response_data, visualization=visualization, session_id=session.session_id
+                        message=response_text, data=response_data, visualization=visualization, session_id=session_id
                     )
                 except Exception as e:
                     logger.error(f"Error re-executing query: {str(e)}", exc_info=True)
@@ -521,14 +730,13 @@ However, I don't see any previous data query to re-visualize. Please:
 Try asking a data question first!"""
 
             # Save assistant message
-            assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+            assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
             db.add(assistant_message)
-            db.commit()
 
-            return ChatMessageResponse(message=response_text, session_id=session.session_id)
+            return ChatMessageResponse(message=response_text, session_id=session_id)
 
     # Check if visualization customization request (colors only)
-    if is_visualization_customization_request(request.message):
+    if intents.viz_color:
         logger.info("Detected visualization color customization request")
         response_text = """I understand you'd like to customize the chart colors! 
 
@@ -543,14 +751,13 @@ Currently, the chart colors and styles are automatically set to provide the best
 Would you like to see your data in a different chart type or ask a new question?"""
 
         # Save assistant message
-        assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+        assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
         db.add(assistant_message)
-        db.commit()
 
-        return ChatMessageResponse(message=response_text, session_id=session.session_id)
+        return ChatMessageResponse(message=response_text, session_id=session_id)
 
     # Check if user is asking about edit capabilities
-    if is_edit_capability_question(request.message):
+    if intents.edit_capability:
         logger.info("Detected edit capability question")
         response_text = """Yes! You can edit your data in two ways:
 
@@ -569,46 +776,28 @@ Would you like to see your data in a different chart type or ask a new question?
 You can reference any columns in your dataset, and I'll help you make the changes. Try asking me to make a specific change to your data!"""
 
         # Save assistant message
-        assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+        assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
         db.add(assistant_message)
-        db.commit()
 
-        return ChatMessageResponse(message=response_text, session_id=session.session_id)
+        return ChatMessageResponse(message=response_text, session_id=session_id)
 
     # Check if edit/update request
-    if is_edit_request(request.message):
+    if intents.edit:
         logger.info("Detected data edit request")
 
-        # Get conversation history for context
-        previous_messages = (
-            db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session.session_id)
-            .order_by(ChatMessage.created_at)
-            .limit(10)
-            .all()
-        )
-        conversation_context = []
-        for msg in previous_messages:
-            conversation_context.append({"role": msg.role, "content": msg.content})
-
-        # Get user files
-        files = db.query(FileModel).filter(FileModel.user_id == request.user_id).all()
-        if not files:
-            return ChatMessageResponse(
-                message="No data files found. Please upload a file first.", session_id=session.session_id
-            )
-
-        file_ids = [f.file_id for f in files]
-        catalogs_query = db.query(Catalog).filter(Catalog.file_id.in_(file_ids)).all()
-        catalog_list = [{"file_id": cat.file_id, "summary": cat.summary} for cat in catalogs_query]
+        # Get conversation history for context (oldest first)
+        previous_messages = load_recent_messages(db, session_id)
+        conversation_context = [{"role": msg.role, "content": msg.content} for msg in reversed(previous_messages)]
 
         # Select relevant file
-        selected_file_id = select_relevant_file(request.message, catalog_list)
+        selected_file_id = select_relevant_file(request.message, catalog_list, intents=intents)
         logger.info(f"Selected file for edit: {selected_file_id}")
 
-        # Get catalog summary
-        catalog = db.query(Catalog).filter(Catalog.file_id == selected_file_id).first()
-        catalog_summary = catalog.summary if catalog else "No catalog available"
+        # Get catalog summary (already loaded with the user's files)
+        catalog_summary = next(
+            (cat["summary"] for cat in catalog_list if cat["file_id"] == selected_file_id),
+            "No catalog available"
+        )
 
         # Execute AI batch edit
         try:
@@ -624,47 +813,35 @@ You can reference any columns in your dataset, and I'll help you make the change
 
                 # Save assistant message
                 assistant_message = ChatMessage(
-                    session_id=session.session_id,
+                    session_id=session_id,
                     role="assistant",
                     content=response_text,
                     tool_calls={"sql_executed": result.get("sql_executed"), "rows_affected": result.get("rows_affected")}
                 )
                 db.add(assistant_message)
-                db.commit()
 
                 return ChatMessageResponse(
                     message=response_text,
                     data={"sql_executed": result.get("sql_executed"), "rows_affected": result.get("rows_affected")},
-                    session_id=session.session_id
+                    session_id=session_id
                 )
             else:
                 error_msg = result.get("error", "Unable to execute edit")
-                return ChatMessageResponse(message=f"Error: {error_msg}", session_id=session.session_id)
+                return ChatMessageResponse(message=f"Error: {error_msg}", session_id=session_id)
 
         except Exception as e:
             logger.error(f"Error in data edit: {str(e)}", exc_info=True)
             return ChatMessageResponse(
-                message=f"Error editing data: {str(e)}", session_id=session.session_id
+                message=f"Error editing data: {str(e)}", session_id=session_id
             )
 
     # Check if statistics/insights request (do this BEFORE file selection to avoid SQL generation)
     # IMPORTANT: This must come before the data query flow to catch anomaly/stats requests
-    if is_stats_request(request.message):
+    if intents.stats:
         logger.info(f"Detected statistics/insights request: '{request.message}'")
 
-        # Get user files
-        files = db.query(FileModel).filter(FileModel.user_id == request.user_id).all()
-        if not files:
-            return ChatMessageResponse(
-                message="No data files found. Please upload a file first.", session_id=session.session_id
-            )
-
-        file_ids = [f.file_id for f in files]
-        catalogs_query = db.query(Catalog).filter(Catalog.file_id.in_(file_ids)).all()
-        catalog_list = [{"file_id": cat.file_id, "summary": cat.summary} for cat in catalogs_query]
-
         # Select relevant file (use db session if available)
-        selected_file_id = select_relevant_file(request.message, catalog_list, db)
+        selected_file_id = select_relevant_file(request.message, catalog_list, db, intents=intents)
         logger.info(f"Selected file for stats: {selected_file_id}")
 
         if not selected_file_id:
@@ -672,15 +849,14 @@ You can reference any columns in your dataset, and I'll help you make the change
             if len(catalog_list) > 1:
                 file_list_items = []
                 for i, cat in enumerate(catalog_list):
-                    file_info = db.query(FileModel).filter(FileModel.file_id == cat["file_id"]).first()
-                    filename = file_info.original_filename if file_info else cat["file_id"]
+                    # original_filename was loaded with the catalogs, so no per-file lookup
+                    filename = cat["original_filename"]
                     file_list_items.append(f"File {i+1}: {filename} (ID: {cat['file_id']})")
                 file_list_text = "\n".join([f"- {item}" for item in file_list_items])
                 response_text = f"I found {len(catalog_list)} files. Which file would you like to analyze for anomalies?\n\n{file_list_text}\n\nYou can specify a file by saying:\n- 'show anomalies in file 1'\n- 'find outliers in file 2'"
-                assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+                assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
                 db.add(assistant_message)
-                db.commit()
-                return ChatMessageResponse(message=response_text, session_id=session.session_id)
+                return ChatMessageResponse(message=response_text, session_id=session_id)
             else:
                 selected_file_id = catalog_list[0]["file_id"]
 
@@ -695,12 +871,11 @@ You can reference any columns in your dataset, and I'll help you make the change
             if stats_result.get("has_insights"):
                 # Save assistant message
                 assistant_message = ChatMessage(
-                    session_id=session.session_id,
+                    session_id=session_id,
                     role="assistant",
                     content=stats_result["insights_text"]
                 )
                 db.add(assistant_message)
-                db.commit()
 
                 # Return insights visualization
                 return ChatMessageResponse(
@@ -710,54 +885,33 @@ You can reference any columns in your dataset, and I'll help you make the change
                         show_bar_chart=False,
                         input_data=[stats_result["statistics"]]
                     ),
-                    session_id=session.session_id
+                    session_id=session_id
                 )
             else:
                 error_msg = stats_result.get("error", "Unable to generate insights")
                 logger.error(f"Stats analysis failed: {error_msg}")
-                return ChatMessageResponse(message=f"Error analyzing data: {error_msg}", session_id=session.session_id)
+                return ChatMessageResponse(message=f"Error analyzing data: {error_msg}", session_id=session_id)
 
         except Exception as e:
             logger.error(f"Error in statistical analysis: {str(e)}", exc_info=True)
             return ChatMessageResponse(
-                message=f"Error analyzing data: {str(e)}", session_id=session.session_id
+                message=f"Error analyzing data: {str(e)}", session_id=session_id
             )
 
     # Data query flow
-    # Step 1: Get conversation history for context (reorder to chronological)
-    conversation_messages_chronological = list(reversed(previous_messages))  # Reverse to get chronological order
-    
-    conversation_context = []
-    for msg in conversation_messages_chronological:
-        msg_dict = {"role": msg.role, "content": msg.content}
-        # Include tool_calls (SQL queries) if available to help understand context
-        if msg.tool_calls:
-            msg_dict["tool_calls"] = msg.tool_calls
-        conversation_context.append(msg_dict)
-
-    # Step 2: Retrieve catalog
-    files = db.query(FileModel).filter(FileModel.user_id == request.user_id).all()
-    if not files:
-        return ChatMessageResponse(
-            message="No data files found. Please upload a file first.", session_id=session.session_id
-        )
-
-    file_ids = [f.file_id for f in files]
-    catalogs_query = db.query(Catalog).filter(Catalog.file_id.in_(file_ids)).all()
-    # Create a map of file_id to file info for easier lookup
-    file_map = {f.file_id: f for f in files}
-    catalog_list = [
-        {
-            "file_id": cat.file_id,
-            "summary": cat.summary,
-            "original_filename": file_map[cat.file_id].original_filename if cat.file_id in file_map else cat.file_id
-        }
-        for cat in catalogs_query
+    # Step 1: Get conversation history for context (loaded only now, so the branches above skip the query)
+    previous_messages = load_recent_messages(db, session_id)
+    # Only the messages the SQL prompt quotes are converted, oldest first; a reply's SQL query
+    # (the only tool_calls entry the prompt reads) is included when present to help understand context
+    conversation_context = [
+        {"role": msg.role, "content": msg.content, **({"tool_calls": {"sql_query": msg.sql_query}} if msg.sql_query else {})}
+        for msg in reversed(previous_messages[:SQL_PROMPT_HISTORY_MESSAGES])
     ]
 
+    # Step 2: Catalogs were loaded with the user's files above
     if not catalog_list:
         return ChatMessageResponse(
-            message="No data files found. Please upload a file first.", session_id=session.session_id
+            message="No data files found. Please upload a file first.", session_id=session_id
         )
 
     logger.info(f"Found {len(catalog_list)} catalogs for user {request.user_id}")
@@ -767,36 +921,28 @@ You can reference any columns in your dataset, and I'll help you make the change
     is_follow_up_file_selection = False
     original_query_intent = None  # Store the original query intent
     last_user_msg_for_context = None  # Store the last user message for context
-    if previous_messages and len(previous_messages) > 0:
-        last_assistant_msg = None
+    if previous_messages:
         # previous_messages is already in reverse chronological order (most recent first)
         # Structure: [0] = most recent (user: "file 1"), [1] = assistant ("which file..."), [2] = user (original query)
-        # Find the assistant's file selection prompt first
-        for msg in previous_messages:
-            if msg.role == "assistant":
-                last_assistant_msg = msg.content
-                break
-        
-        # Then find the user message that came BEFORE the assistant's file selection prompt
-        # This is the original query (e.g., "tell me about the file", "show stats", "show me sources")
+        # One pass finds the latest assistant message and the user message that came BEFORE
+        # the assistant's file selection prompt (the original query, e.g. "show stats")
+        last_assistant_msg = None
+        last_assistant_is_prompt = False
         found_file_prompt = False
         for msg in previous_messages:
-            if msg.role == "assistant" and (
-                "Which file would you like to know about" in msg.content or 
-                "Which file would you like to query" in msg.content or
-                "Which file would you like to analyze" in msg.content
-            ):
-                found_file_prompt = True
+            if msg.role == "assistant":
+                is_prompt = _is_file_prompt(msg.content)
+                if last_assistant_msg is None:
+                    last_assistant_msg = msg.content
+                    last_assistant_is_prompt = is_prompt
+                found_file_prompt = found_file_prompt or is_prompt
             elif msg.role == "user" and found_file_prompt:
-                # This is the user message before the file selection prompt (the original query)
                 last_user_msg_for_context = msg.content
                 break
         
         # Check if last assistant message was asking which file (for metadata or data queries)
         if last_assistant_msg and (
-            "Which file would you like to know about" in last_assistant_msg or 
-            "Which file would you like to query" in last_assistant_msg or
-            "Which file would you like to analyze" in last_assistant_msg or
+            last_assistant_is_prompt or
             ("I found" in last_assistant_msg and "files" in last_assistant_msg and "Which file" in last_assistant_msg)
         ):
             is_follow_up_file_selection = True
@@ -807,24 +953,32 @@ You can reference any columns in your dataset, and I'll help you make the change
                 logger.info(f"Original query message: {last_user_msg_for_context}")
                 
                 # Check what type of query it was
-                if is_file_metadata_question(last_user_msg_for_context):
+                last_user_msg_lower = last_user_msg_for_context.lower()
+                if is_file_metadata_question(last_user_msg_lower):
                     original_query_intent = "metadata"
-                elif is_stats_request(last_user_msg_for_context):
+                elif is_stats_request(last_user_msg_lower):
                     original_query_intent = "stats"
                 else:
                     original_query_intent = "data_query"
                 logger.info(f"Detected query intent: {original_query_intent}")
             else:
                 # Fallback: check the current message for intent
-                if is_file_metadata_question(request.message):
+                if intents.metadata:
                     original_query_intent = "metadata"
-                elif is_stats_request(request.message):
+                elif intents.stats:
                     original_query_intent = "stats"
                 else:
                     original_query_intent = "data_query"
     
     # Step 4: Select relevant file (considering conversation context)
-    selected_file_id = select_relevant_file(request.message, catalog_list, db)
+    # A reply to the "which file" prompt is usually just a file number, so resolve that directly
+    selected_file_id = None
+    if is_follow_up_file_selection:
+        file_num = parse_file_number(intents.lower, len(catalog_list))
+        if file_num:
+            selected_file_id = catalog_list[file_num - 1]["file_id"]
+    if selected_file_id is None:
+        selected_file_id = select_relevant_file(request.message, catalog_list, db, intents=intents)
     logger.info(f"Selected file: {selected_file_id}")
 
     # Handle ambiguous file selection (multiple files, no specific file mentioned)
@@ -837,18 +991,16 @@ You can reference any columns in your dataset, and I'll help you make the change
         file_list_text = "\n".join([f"- {item}" for item in file_list_items])
         
         # Check if it's a metadata question or data query
-        is_metadata_q = is_file_metadata_question(request.message)
-        if is_metadata_q:
+        if intents.metadata:
             response_text = f"I found {len(catalog_list)} files. Which file would you like to know about?\n\n{file_list_text}\n\nYou can specify a file by saying:\n- 'file 1', 'file2', 'file 3', etc.\n- 'tell me about file 1'\n- 'what is file 2 about'"
         else:
             response_text = f"I found {len(catalog_list)} files. Which file would you like to query?\n\n{file_list_text}\n\nPlease specify which file by saying:\n- 'file 1' or 'file2' or 'file 3', etc.\n- 'show last 5 rows from file 1'\n- 'file 2: show last 5 rows'\n- Or just 'file 1', 'file2', etc. and I'll use that file for your query."
         
         # Save assistant message
-        assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+        assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
         db.add(assistant_message)
-        db.commit()
         
-        return ChatMessageResponse(message=response_text, session_id=session.session_id)
+        return ChatMessageResponse(message=response_text, session_id=session_id)
     
     # If still no file selected after file selection prompt (shouldn't happen, but safety check)
     # Only default if we're not in a file selection flow
@@ -863,7 +1015,7 @@ You can reference any columns in your dataset, and I'll help you make the change
             logger.error(f"No file selected with {len(catalog_list)} files. This should have been caught earlier.")
             return ChatMessageResponse(
                 message="I'm having trouble determining which file to use. Please specify which file you'd like to query.",
-                session_id=session.session_id
+                session_id=session_id
             )
 
     # Handle follow-up file selection
@@ -873,23 +1025,19 @@ You can reference any columns in your dataset, and I'll help you make the change
             # User selected a file after being asked "which file"
             # Use the original query intent, not the current message (which is just "file 1" or "file2")
             if original_query_intent == "metadata":
-                # Query catalog table directly for file description
-                catalog = db.query(Catalog).filter(Catalog.file_id == selected_file_id).first()
+                # The file description was loaded with catalog_list, so no catalog/file lookup here
+                catalog = next((cat for cat in catalog_list if cat["file_id"] == selected_file_id), None)
                 if catalog:
-                    file_info = db.query(FileModel).filter(FileModel.file_id == selected_file_id).first()
-                    original_filename = file_info.original_filename if file_info else selected_file_id
-                    
-                    response_text = f"**File: {original_filename}**\n\n{catalog.summary}"
+                    response_text = f"**File: {catalog['original_filename']}**\n\n{catalog['summary']}"
                     
                     # Save assistant message
-                    assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+                    assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
                     db.add(assistant_message)
-                    db.commit()
                     
-                    return ChatMessageResponse(message=response_text, session_id=session.session_id)
+                    return ChatMessageResponse(message=response_text, session_id=session_id)
                 else:
                     return ChatMessageResponse(
-                        message=f"Catalog not found for file {selected_file_id}", session_id=session.session_id
+                        message=f"Catalog not found for file {selected_file_id}", session_id=session_id
                     )
             elif original_query_intent == "stats":
                 # It's a stats request - run statistical analysis
@@ -906,12 +1054,11 @@ You can reference any columns in your dataset, and I'll help you make the change
                     if stats_result.get("has_insights"):
                         # Save assistant message
                         assistant_message = ChatMessage(
-                            session_id=session.session_id,
+                            session_id=session_id,
                             role="assistant",
                             content=stats_result["insights_text"]
                         )
                         db.add(assistant_message)
-                        db.commit()
                         
                         # Return insights visualization
                         return ChatMessageResponse(
@@ -921,24 +1068,24 @@ You can reference any columns in your dataset, and I'll help you make the change
                                 show_bar_chart=False,
                                 input_data=[stats_result["statistics"]]
                             ),
-                            session_id=session.session_id
+                            session_id=session_id
                         )
                     else:
                         error_msg = stats_result.get("error", "Unable to generate insights")
                         logger.error(f"Stats analysis failed: {error_msg}")
-                        return ChatMessageResponse(message=f"Error analyzing data: {error_msg}", session_id=session.session_id)
+                        return ChatMessageResponse(message=f"Error analyzing data: {error_msg}", session_id=session_id)
                 except Exception as e:
                     logger.error(f"Error in statistical analysis: {str(e)}", exc_info=True)
                     return ChatMessageResponse(
-                        message=f"Error analyzing data: {str(e)}", session_id=session.session_id
+                        message=f"Error analyzing data: {str(e)}", session_id=session_id
                     )
             else:
                 # It's a data query - proceed with SQL generation using the selected file
                 # Use the original query message, not just "file 1"
                 original_query = last_user_msg_for_context if last_user_msg_for_context else request.message
                 logger.info(f"User selected file {selected_file_id} for data query. Original query: {original_query}")
-                # Update request.message to use the original query for SQL generation
-                request.message = original_query
+                # Use the original query for SQL generation (the request model is frozen)
+                request = request.model_copy(update={"message": original_query})
                 # Continue to SQL generation below
         else:
             # User responded to "which file" prompt but we couldn't identify which file
@@ -952,56 +1099,53 @@ You can reference any columns in your dataset, and I'll help you make the change
             response_text = f"I couldn't identify which file you meant. Please specify which file:\n\n{file_list_text}\n\nYou can say:\n- 'file 1' or 'file2' or 'file 3'\n- '1' or '2' or '3'\n- 'first file' or 'second file'"
             
             # Save assistant message
-            assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+            assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
             db.add(assistant_message)
-            db.commit()
             
-            return ChatMessageResponse(message=response_text, session_id=session.session_id)
+            return ChatMessageResponse(message=response_text, session_id=session_id)
     
     # Handle file metadata questions (when file is already selected and it's a metadata question)
-    if is_file_metadata_question(request.message) and selected_file_id and not is_follow_up_file_selection:
-        # Query catalog table directly for file description
-        catalog = db.query(Catalog).filter(Catalog.file_id == selected_file_id).first()
+    if intents.metadata and selected_file_id and not is_follow_up_file_selection:
+        # The file description was loaded with catalog_list, so no catalog/file lookup here
+        catalog = next((cat for cat in catalog_list if cat["file_id"] == selected_file_id), None)
         if catalog:
-            file_info = db.query(FileModel).filter(FileModel.file_id == selected_file_id).first()
-            original_filename = file_info.original_filename if file_info else selected_file_id
-            
-            response_text = f"**File: {original_filename}**\n\n{catalog.summary}"
+            response_text = f"**File: {catalog['original_filename']}**\n\n{catalog['summary']}"
             
             # Save assistant message
-            assistant_message = ChatMessage(session_id=session.session_id, role="assistant", content=response_text)
+            assistant_message = ChatMessage(session_id=session_id, role="assistant", content=response_text)
             db.add(assistant_message)
-            db.commit()
             
-            return ChatMessageResponse(message=response_text, session_id=session.session_id)
+            return ChatMessageResponse(message=response_text, session_id=session_id)
         else:
             return ChatMessageResponse(
-                message=f"Catalog not found for file {selected_file_id}", session_id=session.session_id
+                message=f"Catalog not found for file {selected_file_id}", session_id=session_id
             )
 
     # Step 4: Generate SQL with conversation context
+    # Only the selected file's catalog goes into the prompt; the query may only use that table
     logger.info(f"Generating SQL for question: {request.message}")
+    selected_catalogs = [cat for cat in catalog_list if cat["file_id"] == selected_file_id] or catalog_list
     try:
         sql_query = gemini_service.generate_sql_query(
             user_question=request.message,
-            catalog_summaries=catalog_list,
+            catalog_summaries=selected_catalogs,
             selected_file_id=selected_file_id,
             conversation_history=conversation_context,
         )
         logger.info(f"Generated SQL: {sql_query}")
     except Exception as e:
         logger.error(f"Error generating query: {str(e)}", exc_info=True)
-        return ChatMessageResponse(message=f"Error generating query: {str(e)}", session_id=session.session_id)
+        return ChatMessageResponse(message=f"Error generating query: {str(e)}", session_id=session_id)
 
     # Step 4: Execute SQL
     table_name = selected_file_id
     logger.info(f"Executing SQL on table: {table_name}")
     try:
-        rows = sql_executor.execute_query(table_name, sql_query)
-        logger.info(f"Query returned {len(rows)} rows")
+        rows, truncated = run_capped_query(table_name, sql_query)
+        logger.info(f"Query returned {len(rows)} rows (truncated: {truncated})")
     except Exception as e:
         logger.error(f"Error executing query: {str(e)}", exc_info=True)
-        return ChatMessageResponse(message=f"Error executing query: {str(e)}", session_id=session.session_id)
+        return ChatMessageResponse(message=f"Error executing query: {str(e)}", session_id=session_id)
 
     # Step 5: Determine visualization
     columns = list(rows[0].keys()) if rows else []
@@ -1009,54 +1153,56 @@ You can reference any columns in your dataset, and I'll help you make the change
     logger.info(f"Visualization type: {visualization.type if visualization else 'None'}")
 
     # Step 6: Generate response message
-    response_text = f"I found {len(rows)} result(s) for your query."
+    response_text = f"I found {_result_count_text(rows, truncated)} for your query."
     logger.info(f"Preparing response with {len(rows)} rows")
 
     # Save assistant message with tool calls
     assistant_message = ChatMessage(
-        session_id=session.session_id,
+        session_id=session_id,
         role="assistant",
         content=response_text,
         tool_calls={"sql_query": sql_query, "file_id": selected_file_id, "row_count": len(rows)},
+        sql_query=sql_query,
+        sql_file_id=selected_file_id,
     )
     db.add(assistant_message)
-    db.commit()
 
     # Prepare response
-    response_data = {"rows": rows, "columns": columns, "sql_query": sql_query, "file_id": selected_file_id}
+    response_data = {"rows": rows, "columns": columns, "sql_query": sql_query, "file_id": selected_file_id, "truncated": truncated}
 
-    logger.info(f"Sending response for session {session.session_id}")
+    logger.info(f"Sending response for session {session_id}")
     return ChatMessageResponse(
-        message=response_text, data=response_data, visualization=visualization, session_id=session.session_id
+        message=response_text, data=response_data, visualization=visualization, session_id=session_id
     )
 
 
 @router.post("/sql/execute")
-async def execute_sql(table: str, sql: str, db: Session = Depends(get_db)):
-    """Execute SQL query directly."""
+def execute_sql(table: str, sql: str):
+    """Execute SQL query directly (at most MAX_RESPONSE_ROWS rows)."""
     try:
-        rows = sql_executor.execute_query(table, sql)
+        rows, truncated = run_capped_query(table, sql)
         columns = list(rows[0].keys()) if rows else []
-        return {"rows": rows, "columns": columns}
+        return {"rows": rows, "columns": columns, "truncated": truncated}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/sessions/{user_id}")
-async def get_chat_sessions(user_id: str, db: Session = Depends(get_db)):
+def get_chat_sessions(user_id: str, db: Session = Depends(get_db)):
     """Get chat history for a user."""
+    user_id = validate_uuid(user_id, "user ID")
+    # Messages for all sessions come from one extra IN query instead of one query per session
     sessions = (
-        db.query(ChatSession).filter(ChatSession.user_id == user_id).order_by(ChatSession.created_at.desc()).all()
+        db.query(ChatSession)
+        .options(selectinload(ChatSession.messages))
+        .filter(ChatSession.user_id == user_id)
+        .order_by(ChatSession.created_at.desc())
+        .all()
     )
 
     result = []
     for session in sessions:
-        messages = (
-            db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session.session_id)
-            .order_by(ChatMessage.created_at)
-            .all()
-        )
+        messages = session.messages  # Ordered by created_at via the relationship
 
         result.append(
             {
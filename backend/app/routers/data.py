@@ -1,10 +1,11 @@
 """Data retrieval endpoints for interactive tables."""
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import Optional, List, Dict, Any
-from app.database.connection import get_db
-from app.services.sql_executor import sql_executor
+from fastapi import APIRouter, HTTPException, Query
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Tuple
+from app.services.sql_executor import sql_executor, SEARCH_INDEX_SUFFIX
+import base64
 import logging
+import orjson
 import re
 
 logger = logging.getLogger(__name__)
@@ -12,15 +13,66 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/data", tags=["data"])
 
 
+@lru_cache(maxsize=4096)
+def _quote_column(col: str) -> str:
+    """Quote a column name for a text() query (colons escaped so they are not read as bind params)."""
+    return '"' + col.replace('"', '""').replace(":", "\\:") + '"'
+
+
+@lru_cache(maxsize=256)
+def _search_row_text(columns: Tuple[str, ...]) -> str:
+    """A row's columns as one text value for INSTR search, built once per column set."""
+    return " || char(31) || ".join(f"COALESCE(CAST({_quote_column(col)} AS TEXT), '')" for col in columns)
+
+
+# Result alias for the rowid each page is read with; it feeds next_cursor and is not returned
+_CURSOR_ROWID = "__cursor_rowid"
+
+
+def _encode_cursor(sort_value: Any, rowid: int) -> str:
+    """Opaque cursor for the row after which the next page starts."""
+    return base64.urlsafe_b64encode(orjson.dumps([sort_value, rowid])).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Inverse of _encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        sort_value, rowid = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(rowid, int):
+        raise ValueError("Invalid cursor")
+    return sort_value, rowid
+
+
+def _keyset_condition(sort_expr: Optional[str], descending: bool, sort_value: Any) -> str:
+    """Condition selecting the rows that follow the cursor row in (sort column, rowid) order.
+
+    SQLite sorts NULLs first ascending and last descending, which the NULL branches mirror.
+    """
+    if sort_expr is None:
+        return "rowid > :after_rowid"
+    if descending:
+        if sort_value is None:
+            return f"({sort_expr} IS NULL AND rowid < :after_rowid)"
+        return (
+            f"({sort_expr} < :after_value OR ({sort_expr} = :after_value AND rowid < :after_rowid)"
+            f" OR {sort_expr} IS NULL)"
+        )
+    if sort_value is None:
+        return f"({sort_expr} IS NULL AND rowid > :after_rowid OR {sort_expr} IS NOT NULL)"
+    return f"({sort_expr} > :after_value OR ({sort_expr} = :after_value AND rowid > :after_rowid))"
+
+
 @router.get("/table/{table_name}")
-async def get_table_data(
+def get_table_data(
     table_name: str,
     page: int = Query(1, ge=1, description="Page number (1-indexed)"),
     page_size: int = Query(10, ge=1, le=100, description="Number of rows per page"),
     search: Optional[str] = Query(None, description="Search term to filter rows"),
     sort_by: Optional[str] = Query(None, description="Column name to sort by"),
     sort_order: Optional[str] = Query("asc", regex="^(asc|desc)$", description="Sort order (asc/desc)"),
-    db: Session = Depends(get_db),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page (seeks instead of OFFSET)"),
 ):
     """
     Get paginated, filterable, and sortable data from a table.
@@ -32,7 +84,8 @@ async def get_table_data(
         search: Optional search term to filter rows (searches across all columns)
         sort_by: Optional column name to sort by
         sort_order: Sort order (asc or desc)
-        db: Database session
+        after: Optional cursor from the previous page's next_cursor; the page then starts right
+            after that row via an index seek instead of skipping (page - 1) * page_size rows
     
     Returns:
         Dictionary with paginated data, total count, and pagination metadata
@@ -42,6 +95,12 @@ async def get_table_data(
         if not sql_executor._validate_table_name(table_name):
             raise HTTPException(status_code=400, detail=f"Invalid table name: {table_name}")
         
+        # Repeat requests for the same view reuse the response until it expires or the table is edited
+        cache_key = ("page", page, page_size, search, sort_by, sort_order, after)
+        cached_response = sql_executor.get_cached_read(table_name, cache_key)
+        if cached_response is not None:
+            return cached_response
+        
         # Get table schema to get column names
         try:
             schema = sql_executor.get_table_schema(table_name)
@@ -53,91 +112,112 @@ async def get_table_data(
             raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
         
         # Build WHERE clause for search
+        # The search term is always a bound parameter, never part of the SQL text, so the
+        # statement is identical across searches and pages and can be reused by the driver
         where_clause = ""
+        params: Dict[str, Any] = {}
         if search and search.strip():
-            # Sanitize search term (prevent SQL injection)
             search_term = search.strip()
-            # Remove dangerous characters (keep only alphanumeric, spaces, and common safe chars)
-            # Escape single quotes for SQL
-            search_term_escaped = search_term.replace("'", "''")
-            
-            # Build search conditions for all columns (use LIKE for pattern matching)
-            search_conditions = []
-            for col in columns:
-                # Quote column names that might have spaces
-                quoted_col = f'"{col}"' if ' ' in col or '-' in col else col
-                # Use LIKE with escaped search term and CAST to TEXT for type safety
-                search_conditions.append(f'CAST({quoted_col} AS TEXT) LIKE \'%{search_term_escaped}%\'')
             
-            if search_conditions:
-                where_clause = "WHERE " + " OR ".join(search_conditions)
+            if len(search_term) >= 3 and sql_executor.has_search_index(table_name):
+                # Substring match through the trigram FTS5 index instead of scanning every column
+                # (trigrams need at least 3 characters; the term is quoted as an FTS phrase)
+                fts_table = f"{table_name}{SEARCH_INDEX_SUFFIX}"
+                where_clause = f'WHERE rowid IN (SELECT rowid FROM "{fts_table}" WHERE "{fts_table}" MATCH :search)'
+                params["search"] = '"' + search_term.replace('"', '""') + '"'
+            else:
+                # One case-insensitive INSTR over all columns joined by a unit separator (char(31)),
+                # instead of a LIKE per column; CAST to TEXT for type safety
+                where_clause = f"WHERE INSTR(LOWER({_search_row_text(tuple(columns))}), LOWER(:search)) > 0"
+                params["search"] = search_term
         
-        # Build ORDER BY clause
+        # Build ORDER BY clause (rowid breaks ties so every page boundary is well defined)
         order_by_clause = ""
+        sort_expr = None
+        descending = False
         if sort_by:
             # Validate sort_by column name
             if sort_by not in columns:
                 raise HTTPException(status_code=400, detail=f"Invalid sort column: {sort_by}")
             
-            # Quote column name if it has spaces
-            quoted_sort_col = f'"{sort_by}"' if ' ' in sort_by or '-' in sort_by else sort_by
-            order_by = "DESC" if sort_order and sort_order.lower() == "desc" else "ASC"
-            order_by_clause = f"ORDER BY {quoted_sort_col} {order_by}"
+            # Case-insensitive for text (numbers order the same), matching the upload's sort indexes
+            sort_expr = f"{_quote_column(sort_by)} COLLATE NOCASE"
+            descending = bool(sort_order and sort_order.lower() == "desc")
+            order_by = "DESC" if descending else "ASC"
+            order_by_clause = f"ORDER BY {sort_expr} {order_by}, rowid {order_by}"
         
         # Calculate offset
         offset = (page - 1) * page_size
         
-        # Quote table name if it's long or has special characters
-        quoted_table = f'"{table_name}"' if len(table_name) > 30 or '_' in table_name else table_name
+        # Always quote the table name (it is validated as [a-zA-Z0-9_]+ above)
+        quoted_table = f'"{table_name}"'
         
-        # Build query for total count
-        count_query = f'SELECT COUNT(*) as total FROM {quoted_table}'
-        if where_clause:
-            count_query += f" {where_clause}"
-        
-        # Execute count query
+        # Total count (cached briefly, so paging and re-sorting the same view skip the COUNT(*) scan)
         try:
-            count_result = sql_executor.execute_query(table_name, count_query)
-            total_rows = count_result[0]["total"] if count_result else 0
+            total_rows = sql_executor.count_rows(table_name, where_clause, params)
         except Exception as e:
             logger.error(f"Error executing count query: {str(e)}")
             total_rows = 0
         
         # Build main query with pagination
-        main_query = f'SELECT * FROM {quoted_table}'
-        if where_clause:
-            main_query += f" {where_clause}"
+        # With a cursor, seek past the previous page's last row instead of counting off OFFSET rows
+        page_where_clause = where_clause
+        keyset = None
+        page_params = {"limit": page_size, "offset": offset}
+        if after:
+            try:
+                after_value, after_rowid = _decode_cursor(after)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            keyset = _keyset_condition(sort_expr, descending, after_value)
+            page_where_clause = f"{where_clause} AND {keyset}" if where_clause else f"WHERE {keyset}"
+            page_params = {"limit": page_size, "offset": 0, "after_value": after_value, "after_rowid": after_rowid}
+        
+        main_query = f'SELECT *, rowid AS {_CURSOR_ROWID} FROM {quoted_table}'
+        if page_where_clause:
+            main_query += f" {page_where_clause}"
         if order_by_clause:
             main_query += f" {order_by_clause}"
         else:
             # Default sort by rowid for consistent pagination
             main_query += " ORDER BY rowid ASC"
         
-        main_query += f" LIMIT {page_size} OFFSET {offset}"
+        main_query += " LIMIT :limit OFFSET :offset"
         
-        # Execute main query
+        # Execute main query (rows as tuples in column order, not per-row dicts)
         try:
-            rows = sql_executor.execute_query(table_name, main_query)
+            result_columns, rows = sql_executor.execute_query_rows(table_name, main_query, params={**params, **page_params})
         except Exception as e:
             logger.error(f"Error executing main query: {str(e)}")
             # If query fails, try without search parameters (might be issue with parameterized query)
             # Fallback to simple query
-            simple_query = f'SELECT * FROM {quoted_table}'
+            simple_query = f'SELECT *, rowid AS {_CURSOR_ROWID} FROM {quoted_table}'
+            if keyset:
+                # Still seek past the cursor; without it this would silently return the first page
+                simple_query += f" WHERE {keyset}"
             if order_by_clause:
                 simple_query += f" {order_by_clause}"
             else:
                 simple_query += " ORDER BY rowid ASC"
-            simple_query += f" LIMIT {page_size} OFFSET {offset}"
-            rows = sql_executor.execute_query(table_name, simple_query)
+            simple_query += " LIMIT :limit OFFSET :offset"
+            result_columns, rows = sql_executor.execute_query_rows(table_name, simple_query, params=page_params)
         
         # Calculate pagination metadata
         total_pages = (total_rows + page_size - 1) // page_size if total_rows > 0 else 0
         has_next = page < total_pages
         has_previous = page > 1
         
-        return {
-            "data": rows,
-            "columns": columns,
+        # Cursor for the next page, taken from the last row (its rowid, the last value, is not part of the data)
+        next_cursor = None
+        if len(rows) == page_size:
+            last_row = rows[-1]
+            sort_value = last_row[result_columns.index(sort_by)] if sort_by else None
+            next_cursor = _encode_cursor(sort_value, last_row[-1])
+        rows = [row[:-1] for row in rows]
+        
+        response = {
+            "columns": result_columns[:-1],
+            "rows": rows,
             "pagination": {
                 "page": page,
                 "page_size": page_size,
@@ -145,8 +225,11 @@ async def get_table_data(
                 "total_pages": total_pages,
                 "has_next": has_next,
                 "has_previous": has_previous,
+                "next_cursor": next_cursor,
             },
         }
+        sql_executor.cache_read(table_name, cache_key, response)
+        return response
     
     except HTTPException:
         raise
@@ -156,16 +239,14 @@ async def get_table_data(
 
 
 @router.get("/table/{table_name}/columns")
-async def get_table_columns(
+def get_table_columns(
     table_name: str,
-    db: Session = Depends(get_db),
 ):
     """
     Get column names and types for a table.
     
     Args:
         table_name: Name of the table
-        db: Database session
     
     Returns:
         Dictionary with column names and types
@@ -175,6 +256,10 @@ async def get_table_columns(
         if not sql_executor._validate_table_name(table_name):
             raise HTTPException(status_code=400, detail=f"Invalid table name: {table_name}")
         
+        cached_response = sql_executor.get_cached_read(table_name, ("columns",))
+        if cached_response is not None:
+            return cached_response
+        
         # Get table schema
         schema = sql_executor.get_table_schema(table_name)
         columns = schema.get("columns", [])
@@ -183,10 +268,12 @@ async def get_table_columns(
         if not columns:
             raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found or has no columns")
         
-        return {
+        response = {
             "columns": columns,
             "column_types": column_types,
         }
+        sql_executor.cache_read(table_name, ("columns",), response)
+        return response
     
     except HTTPException:
         raise
@@ -1,11 +1,13 @@
 """Data editing routes."""
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.database.connection import get_db
 from app.models.catalog import Catalog, File as FileModel
 from app.services.data_editor import data_editor
+from app.utils.validators import validate_uuid
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, List, Any
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,12 +22,30 @@ class UpdateRowRequest(BaseModel):
     updates: Dict[str, Any]
 
 
+class RowUpdate(BaseModel):
+    """Updates for one row of a multi-row edit."""
+    row_id: int
+    updates: Dict[str, Any]
+
+
+class UpdateRowsRequest(BaseModel):
+    """Request to update several rows at once."""
+    table_name: str
+    rows: List[RowUpdate]
+
+
 class InsertRowRequest(BaseModel):
     """Request to insert a new row."""
     table_name: str
     data: Dict[str, Any]
 
 
+class InsertRowsRequest(BaseModel):
+    """Request to insert several rows at once."""
+    table_name: str
+    rows: List[Dict[str, Any]]
+
+
 class DeleteRowRequest(BaseModel):
     """Request to delete a row."""
     table_name: str
@@ -40,7 +60,7 @@ class AIBatchEditRequest(BaseModel):
 
 
 @router.post("/update-row")
-async def update_row(request: UpdateRowRequest, db: Session = Depends(get_db)):
+def update_row(request: UpdateRowRequest, db: Session = Depends(get_db)):
     """Update a single row."""
     logger.info(f"Update row request for table {request.table_name}, row {request.row_id}")
 
@@ -56,8 +76,24 @@ async def update_row(request: UpdateRowRequest, db: Session = Depends(get_db)):
     return result
 
 
+@router.post("/update-rows")
+def update_rows(request: UpdateRowsRequest, db: Session = Depends(get_db)):
+    """Update several rows in one transaction."""
+    logger.info(f"Update rows request for table {request.table_name}, {len(request.rows)} row(s)")
+
+    result = data_editor.update_rows(
+        table_name=request.table_name,
+        row_updates=[(row.row_id, row.updates) for row in request.rows]
+    )
+
+    if not result.get("success"):
+        raise HTTPException(status_code=400, detail=result.get("error", "Update failed"))
+
+    return result
+
+
 @router.post("/insert-row")
-async def insert_row(request: InsertRowRequest, db: Session = Depends(get_db)):
+def insert_row(request: InsertRowRequest, db: Session = Depends(get_db)):
     """Insert a new row."""
     logger.info(f"Insert row request for table {request.table_name}")
 
@@ -72,8 +108,24 @@ async def insert_row(request: InsertRowRequest, db: Session = Depends(get_db)):
     return result
 
 
+@router.post("/insert-rows")
+def insert_rows(request: InsertRowsRequest, db: Session = Depends(get_db)):
+    """Insert several rows in one transaction."""
+    logger.info(f"Insert rows request for table {request.table_name}, {len(request.rows)} row(s)")
+
+    result = data_editor.insert_rows(
+        table_name=request.table_name,
+        rows=request.rows
+    )
+
+    if not result.get("success"):
+        raise HTTPException(status_code=400, detail=result.get("error", "Insert failed"))
+
+    return result
+
+
 @router.post("/delete-row")
-async def delete_row(request: DeleteRowRequest, db: Session = Depends(get_db)):
+def delete_row(request: DeleteRowRequest, db: Session = Depends(get_db)):
     """Delete a row."""
     logger.info(f"Delete row request for table {request.table_name}, row {request.row_id}")
 
@@ -89,21 +141,22 @@ async def delete_row(request: DeleteRowRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/ai-batch-edit")
-async def ai_batch_edit(request: AIBatchEditRequest, db: Session = Depends(get_db)):
+def ai_batch_edit(request: AIBatchEditRequest, db: Session = Depends(get_db)):
     """Execute AI-driven batch edit based on natural language instruction."""
     logger.info(f"AI batch edit request: {request.instruction}")
+    user_id = validate_uuid(request.user_id, "user ID")
 
-    # Get catalog for context
-    file_record = db.query(FileModel).filter(
-        FileModel.file_id == request.table_name,
-        FileModel.user_id == request.user_id
+    # Check the table belongs to the user and get its catalog summary for context in one query
+    file_row = db.execute(
+        select(FileModel.file_id, Catalog.summary)
+        .outerjoin(Catalog, Catalog.file_id == FileModel.file_id)
+        .where(FileModel.file_id == request.table_name, FileModel.user_id == user_id)
     ).first()
 
-    if not file_record:
+    if not file_row:
         raise HTTPException(status_code=404, detail="Table not found")
 
-    catalog = db.query(Catalog).filter(Catalog.file_id == request.table_name).first()
-    catalog_summary = catalog.summary if catalog else "No catalog available"
+    catalog_summary = file_row.summary or "No catalog available"
 
     result = data_editor.ai_batch_edit(
         table_name=request.table_name,
@@ -1,22 +1,29 @@
 """File upload routes."""
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, Depends, HTTPException
+from sqlalchemy import select, text
 from sqlalchemy.orm import Session
-from app.database.connection import get_db
-from app.models.catalog import File as FileModel
+from app.database.connection import get_db, SessionLocal
+from app.models.catalog import Catalog, File as FileModel
 from app.services.data_processor import load_csv, load_json
 from app.services.catalog_generator import generate_catalog
-from app.services.sql_executor import sql_executor
+from app.services.sql_executor import sql_executor, SEARCH_INDEX_SUFFIX
 from app.utils.file_handler import (
     generate_file_id,
+    get_catalog_path,
     get_file_path,
-    save_file
 )
-from app.utils.validators import validate_file_type
-from app.config import settings
+from app.utils.validators import validate_file_type, validate_uuid
+from app.config import Settings, get_settings
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Uploads are written to disk this many bytes at a time
+UPLOAD_CHUNK_SIZE = 1 << 20
+
 router = APIRouter(prefix="/api/upload", tags=["upload"])
 
 
@@ -24,20 +31,79 @@ class UploadResponse(BaseModel):
     """Upload response model."""
     file_id: str
     filename: str
-    status: str
-    row_count: int
+    status: str  # processing until the background task marks it uploaded or failed
+    row_count: Optional[int] = None
+
 
+def _process_upload(file_id: str, file_path: str, file_ext: str) -> None:
+    """Load an accepted upload, generate its catalog and SQL table, and mark the file uploaded or failed."""
+    db = SessionLocal()
+    try:
+        if db.get(FileModel, file_id) is None:
+            logger.info(f"File {file_id} was deleted before processing started")
+            return
 
-@router.post("/", response_model=UploadResponse)
+        if file_ext == "csv":
+            df = load_csv(file_path)
+        else:
+            df = load_json(file_path)
+        
+        logger.info("Generating catalog...")
+        catalog_data = generate_catalog(df, file_id)
+        
+        # Drop a leftover table from a previous failed upload before recreating it
+        table_name = file_id
+        logger.info(f"Creating SQL table: {table_name}")
+        db.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+        db.commit()
+        sql_executor.create_table_from_dataframe(df, table_name)
+        
+        # Replace a catalog left behind by an earlier upload with the same file_id
+        db.query(Catalog).filter(Catalog.file_id == file_id).delete()
+        db.add(Catalog(
+            file_id=file_id,
+            summary=catalog_data["summary"],
+            metadata_json=catalog_data["metadata"]
+        ))
+        marked = db.query(FileModel).filter(FileModel.file_id == file_id).update(
+            {FileModel.status: "uploaded", FileModel.row_count: len(df)}
+        )
+        if not marked:
+            # The file was deleted while it was processing; its delete may have run before the
+            # table existed, so drop the table here instead of leaving it and the catalog orphaned
+            logger.info(f"File {file_id} was deleted during processing; discarding its table")
+            db.rollback()
+            db.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+            db.execute(text(f'DROP TABLE IF EXISTS "{table_name}{SEARCH_INDEX_SUFFIX}"'))
+            db.commit()
+            sql_executor.invalidate_table(table_name)
+            sql_executor.invalidate_schema(table_name)
+            _remove_files(file_path, get_catalog_path(file_id))
+            return
+        db.commit()
+        logger.info(f"Upload processed. File ID: {file_id}, Rows: {len(df)}")
+    except Exception as e:
+        logger.error(f"Error processing upload {file_id}: {str(e)}", exc_info=True)
+        db.rollback()
+        db.query(FileModel).filter(FileModel.file_id == file_id).update({FileModel.status: "failed"})
+        db.commit()
+        # Clean up file on error
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    finally:
+        db.close()
+
+
+@router.post("/", response_model=UploadResponse, status_code=202)
 async def upload_file(
+    background_tasks: BackgroundTasks,
     user_id: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings)
 ):
-    """Upload a file and process it."""
-    import logging
-    logger = logging.getLogger(__name__)
-    
+    """Save an uploaded file and process it in the background (poll GET /api/upload/{file_id} for its status)."""
+    user_id = validate_uuid(user_id, "user ID")
     try:
         logger.info(f"Received upload request for user {user_id}, file: {file.filename}")
         
@@ -49,148 +115,63 @@ async def upload_file(
             logger.error(f"File type validation failed: {str(e)}")
             raise HTTPException(status_code=400, detail=f"Invalid file type: {str(e)}")
         
-        # Read file content
-        try:
-            content = await file.read()
-            file_size = len(content)
-            logger.info(f"File read successfully. Size: {file_size} bytes")
-        except Exception as e:
-            logger.error(f"Error reading file: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
-        
-        # Check file size
-        if file_size > settings.MAX_FILE_SIZE:
-            logger.warning(f"File size {file_size} exceeds maximum {settings.MAX_FILE_SIZE}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"File size ({file_size} bytes) exceeds maximum allowed size of {settings.MAX_FILE_SIZE} bytes ({settings.MAX_FILE_SIZE / 1024 / 1024:.1f} MB)"
-            )
-        
         # Get next available file index for user
         # We need to find the next file_index that doesn't have a conflicting file_id
         # This handles cases where files were deleted or uploads failed
-        existing_files_count = db.query(FileModel).filter(
-            FileModel.user_id == user_id
-        ).count()
+        # One query for all of the user's file_ids, then find the first free index in Python
+        used_file_ids = {
+            row.file_id for row in db.query(FileModel.file_id).filter(FileModel.user_id == user_id)
+        }
         
-        # Start with the count + 1, but check for conflicts
-        file_index = existing_files_count + 1
+        # Start with the count + 1, but skip indexes that are already taken
+        file_index = len(used_file_ids) + 1
         file_id = generate_file_id(user_id, file_index, file_ext)
-        
-        # Check if file_id already exists, if so, find next available index
-        max_attempts = 100  # Prevent infinite loop
-        attempt = 0
-        while db.query(FileModel).filter(FileModel.file_id == file_id).first() is not None:
-            attempt += 1
-            if attempt >= max_attempts:
-                # Fallback: use timestamp to make it unique
-                import time
-                file_index = int(time.time() * 1000)  # Use timestamp as index
-                file_id = generate_file_id(user_id, file_index, file_ext)
-                logger.warning(f"Could not find available file_index after {max_attempts} attempts, using timestamp-based index: {file_index}")
-                break
+        while file_id in used_file_ids:
             file_index += 1
             file_id = generate_file_id(user_id, file_index, file_ext)
             logger.info(f"File ID conflict detected, trying next index: {file_index}")
         
         logger.info(f"Generated file_id: {file_id} (index: {file_index})")
         
-        # Save file
+        # Stream the body to disk in 1 MB chunks, checking the size as it arrives
         file_path = get_file_path(file_id, file_ext)
-        save_file(content, file_path)
-        
-        # Load data
-        try:
-            if file_ext == "csv":
-                df = load_csv(file_path)
-            elif file_ext == "json":
-                df = load_json(file_path)
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported file type")
-        except Exception as e:
-            # Clean up file on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
-        
-        # Generate catalog
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        file_size = 0
         try:
-            logger.info("Generating catalog...")
-            catalog_data = generate_catalog(df, file_id)
-            logger.info("Catalog generated successfully")
+            with open(file_path, "wb") as out:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    if file_size > settings.MAX_FILE_SIZE:
+                        break
+                    out.write(chunk)
         except Exception as e:
-            logger.error(f"Error generating catalog: {str(e)}", exc_info=True)
-            # Clean up file on error
+            logger.error(f"Error reading file: {str(e)}")
             if os.path.exists(file_path):
                 os.remove(file_path)
-            raise HTTPException(status_code=500, detail=f"Error generating catalog: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
         
-        # Create SQL table
-        table_name = file_id
-        try:
-            logger.info(f"Creating SQL table: {table_name}")
-            # Check if table already exists and drop it if it does (cleanup from previous failed upload)
-            from sqlalchemy import text, inspect
-            from app.database.connection import engine
-            inspector = inspect(engine)
-            if table_name in inspector.get_table_names():
-                logger.warning(f"Table {table_name} already exists, dropping it before recreating")
-                db.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
-                db.commit()
-            sql_executor.create_table_from_dataframe(df, table_name)
-            logger.info("SQL table created successfully")
-        except Exception as e:
-            logger.error(f"Error creating table: {str(e)}", exc_info=True)
-            # Clean up file on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise HTTPException(status_code=500, detail=f"Error creating table: {str(e)}")
+        # Check file size
+        if file_size > settings.MAX_FILE_SIZE:
+            logger.warning(f"File size exceeds maximum {settings.MAX_FILE_SIZE}")
+            os.remove(file_path)
+            raise HTTPException(
+                status_code=400,
+                detail=f"File size exceeds maximum allowed size of {settings.MAX_FILE_SIZE} bytes ({settings.MAX_FILE_SIZE / 1024 / 1024:.1f} MB)"
+            )
+        logger.info(f"File saved. Size: {file_size} bytes")
         
-        # Save to database
+        # Record the file as processing; parsing, the catalog and the SQL table are built after the response
         try:
-            # Check if file_id already exists (double-check before inserting)
-            existing_file = db.query(FileModel).filter(FileModel.file_id == file_id).first()
-            if existing_file:
-                logger.error(f"File ID {file_id} already exists in database. This should not happen after conflict check.")
-                # Clean up file on error
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                raise HTTPException(
-                    status_code=409,
-                    detail=f"A file with ID {file_id} already exists. Please try uploading again or delete the existing file first."
-                )
-            
             file_record = FileModel(
                 file_id=file_id,
                 user_id=user_id,
                 original_filename=file.filename,
                 file_type=file_ext,
                 file_path=file_path,
-                row_count=len(df)
+                status="processing",
             )
             db.add(file_record)
-            
-            # Save catalog to database
-            # Check if catalog already exists and delete it if it does
-            from app.models.catalog import Catalog
-            existing_catalog = db.query(Catalog).filter(Catalog.file_id == file_id).first()
-            if existing_catalog:
-                logger.warning(f"Catalog for file_id {file_id} already exists, deleting it")
-                db.delete(existing_catalog)
-            
-            catalog_record = Catalog(
-                file_id=file_id,
-                summary=catalog_data["summary"],
-                metadata_json=catalog_data["metadata"]
-            )
-            db.add(catalog_record)
-            
             db.commit()
-            db.refresh(file_record)
-            logger.info(f"File and catalog saved to database. File ID: {file_id}")
-        except HTTPException:
-            # Re-raise HTTP exceptions
-            raise
         except Exception as e:
             logger.error(f"Error saving to database: {str(e)}", exc_info=True)
             db.rollback()
@@ -205,12 +186,13 @@ async def upload_file(
                 )
             raise HTTPException(status_code=500, detail=f"Error saving to database: {str(e)}")
         
-        logger.info(f"Upload successful. File ID: {file_id}, Rows: {len(df)}")
+        background_tasks.add_task(_process_upload, file_id, file_path, file_ext)
+        
+        logger.info(f"Upload accepted. File ID: {file_id}")
         return UploadResponse(
             file_id=file_id,
             filename=file.filename,
-            status="uploaded",
-            row_count=len(df)
+            status="processing",
         )
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -220,99 +202,71 @@ async def upload_file(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 
+# Columns returned for a file by list_user_files and get_file_info
+_FILE_INFO_COLUMNS = (
+    FileModel.file_id,
+    FileModel.original_filename.label("filename"),
+    FileModel.file_type,
+    FileModel.status,
+    FileModel.row_count,
+    FileModel.created_at,
+)
+
+
 @router.get("/user/{user_id}")
-async def list_user_files(user_id: str, db: Session = Depends(get_db)):
+def list_user_files(user_id: str, db: Session = Depends(get_db)):
     """List all files for a user."""
-    files = db.query(FileModel).filter(FileModel.user_id == user_id).all()
-
-    return [
-        {
-            "file_id": f.file_id,
-            "filename": f.original_filename,
-            "file_type": f.file_type,
-            "row_count": f.row_count,
-            "created_at": f.created_at
-        }
-        for f in files
-    ]
+    user_id = validate_uuid(user_id, "user ID")
+    # Select just the returned columns (no File entities, so no selectin catalog load either)
+    rows = db.execute(select(*_FILE_INFO_COLUMNS).where(FileModel.user_id == user_id)).all()
+    return [row._asdict() for row in rows]
 
 
 @router.get("/{file_id}")
-async def get_file_info(file_id: str, db: Session = Depends(get_db)):
+def get_file_info(file_id: str, db: Session = Depends(get_db)):
     """Get file information."""
-    file_record = db.query(FileModel).filter(FileModel.file_id == file_id).first()
-    if not file_record:
+    row = db.execute(select(*_FILE_INFO_COLUMNS).where(FileModel.file_id == file_id)).first()
+    if not row:
         raise HTTPException(status_code=404, detail="File not found")
 
-    return {
-        "file_id": file_record.file_id,
-        "filename": file_record.original_filename,
-        "file_type": file_record.file_type,
-        "row_count": file_record.row_count,
-        "created_at": file_record.created_at
-    }
+    return row._asdict()
 
 
-@router.delete("/{file_id}")
-async def delete_file(file_id: str, db: Session = Depends(get_db)):
-    """Delete a file and its associated catalog and SQL table."""
-    from app.models.catalog import Catalog
-    from sqlalchemy import text
-    import logging
+def _remove_files(*paths: str) -> None:
+    """Remove a deleted file's artifacts from disk, skipping any that are already gone."""
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+                logger.info(f"Deleted file: {path}")
+            except Exception as e:
+                logger.warning(f"Could not delete file {path}: {str(e)}")
 
-    logger = logging.getLogger(__name__)
 
+@router.delete("/{file_id}")
+def delete_file(file_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Delete a file and its associated catalog and SQL table."""
     # Find file record
-    file_record = db.query(FileModel).filter(FileModel.file_id == file_id).first()
+    file_record = db.get(FileModel, file_id)
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Delete SQL table (handle both with and without prefixes)
-    table_names_to_try = [
-        file_id,
-        f"base.{file_id}",
-        f"main.{file_id}"
-    ]
-
-    for table_name in table_names_to_try:
-        try:
-            # Use double quotes to handle table names with dots
-            db.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
-            logger.info(f"Attempted to drop table: {table_name}")
-        except Exception as e:
-            logger.warning(f"Could not drop table {table_name}: {str(e)}")
-
-    db.commit()
-
-    # Delete catalog record
-    catalog_record = db.query(Catalog).filter(Catalog.file_id == file_id).first()
-    if catalog_record:
-        db.delete(catalog_record)
-
-    # Delete file record
+    # Delete the catalog and file records, then drop the SQL table and its search index (which
+    # drops its shadow tables too), all in one transaction. The DML must come first: pysqlite
+    # only opens a transaction before DML, so a DROP issued first would autocommit on its own.
+    db.query(Catalog).filter(Catalog.file_id == file_id).delete()
     db.delete(file_record)
+    db.flush()
+    db.execute(text(f'DROP TABLE IF EXISTS "{file_id}"'))
+    db.execute(text(f'DROP TABLE IF EXISTS "{file_id}{SEARCH_INDEX_SUFFIX}"'))
     db.commit()
+    sql_executor.invalidate_table(file_id)
+    sql_executor.invalidate_schema(file_id)
 
-    # Delete physical files
-    if os.path.exists(file_record.file_path):
-        try:
-            os.remove(file_record.file_path)
-            logger.info(f"Deleted file: {file_record.file_path}")
-        except Exception as e:
-            logger.warning(f"Could not delete file {file_record.file_path}: {str(e)}")
-
-    # Delete catalog text file
-    from app.utils.file_handler import get_catalog_path
-    catalog_path = get_catalog_path(file_id)
-    if os.path.exists(catalog_path):
-        try:
-            os.remove(catalog_path)
-            logger.info(f"Deleted catalog: {catalog_path}")
-        except Exception as e:
-            logger.warning(f"Could not delete catalog {catalog_path}: {str(e)}")
+    # Delete the uploaded file and catalog text file after the response is sent
+    background_tasks.add_task(_remove_files, file_record.file_path, get_catalog_path(file_id))
 
     return {
         "message": "File and catalog deleted successfully",
         "file_id": file_id
     }
-
@@ -7,6 +7,7 @@ from app.services.data_processor import (
 )
 from app.services.gemini_service import gemini_service
 from app.utils.file_handler import get_catalog_path
+import gzip
 import pandas as pd
 
 
@@ -20,13 +21,18 @@ def generate_catalog(
     stats = get_basic_stats(df)
     
     # Get distinct values for categorical columns (important for filtering queries)
+    # Object, pandas string and Arrow string columns, plus categoricals with at most 20 distinct values
     categorical_values = {}
-    for col in df.columns:
-        if df[col].dtype == 'object' or df[col].dtype.name == 'category':
-            # Get unique values, limit to first 20 for display
-            unique_vals = df[col].dropna().unique()[:20]
-            if len(unique_vals) <= 20:  # Only include if reasonable number of unique values
-                categorical_values[col] = sorted([str(v) for v in unique_vals])
+    cardinality = stats.get("categorical_cardinality", {})
+    text_df = df.select_dtypes(include=["object", "string", "category"])
+    for col in text_df.columns:
+        # get_basic_stats has already counted distinct values, which rules out names, ids etc.
+        if cardinality.get(col, 0) > 20:
+            continue
+        # Keeping 21 distinct values is enough to tell whether the column has at most 20
+        distinct = text_df[col].dropna().drop_duplicates().head(21).tolist()
+        if len(distinct) <= 20:
+            categorical_values[col] = sorted(str(v) for v in distinct)
     
     # Prepare schema dict
     schema = {
@@ -59,10 +65,10 @@ def generate_catalog(
         }
     }
     
-    # Save catalog to file
+    # Save catalog to file (gzip-compressed; this runs in the upload's background task)
     catalog_path = get_catalog_path(file_id)
-    with open(catalog_path, 'w', encoding='utf-8') as f:
-        f.write(catalog_text)
+    with open(catalog_path, 'wb') as f:
+        f.write(gzip.compress(catalog_text.encode('utf-8')))
     
     return {
         "summary": catalog_text,
@@ -1,17 +1,100 @@
 """Data editing service."""
+import hashlib
 import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from app.database.connection import engine
 from app.services.gemini_service import gemini_service
-from sqlalchemy import text
+from app.services.sql_executor import sql_executor
+from sqlalchemy import bindparam, column, delete, insert, literal_column, table, text, update
+from sqlalchemy.sql.expression import TableClause
+from google.ai import generativelanguage as glm
 import logging
+import re
+import threading
 
 logger = logging.getLogger(__name__)
 
+# SQLite's implicit row id, which the table view uses to address rows
+ROWID = literal_column("rowid")
+
+# Static part of the UPDATE prompt, sent ahead of the per-request values so every call shares
+# the same prefix; the examples write the table as <table>
+UPDATE_SQL_PROMPT_RULES = """You are a SQL expert. Generate an UPDATE statement for SQLite based on the user's instruction.
+
+CRITICAL REQUIREMENTS:
+1. Generate ONLY an UPDATE statement - no SELECT, INSERT, DELETE, or DROP
+2. Use EXACT column names from schema (case-sensitive column names in quotes!)
+   - ALWAYS quote column names with double quotes: "Column Name"
+   - If column has spaces: "Account Id", "Lead Owner", "Deal Stage" (MUST use quotes!)
+   - NEVER use underscores for spaces: "Account Id" NOT Account_Id
+   - Example: "Lead Owner" NOT Lead_Owner or LeadOwner
+3. Use proper SQL syntax for SQLite
+4. Be precise with WHERE clause to match user's intent
+5. Use mathematical operations correctly (e.g., "RetailDollars" * 1.10 for 10% increase)
+6. For string comparisons, use case-insensitive matching: UPPER("Column Name") = UPPER('value') or "Column Name" COLLATE NOCASE = 'value'
+7. For "last row" or "last data", identify the row using a subquery:
+   - Match the specific value mentioned (e.g., name) case-insensitively
+   - Use rowid in subquery to target the specific row: WHERE rowid = (SELECT rowid FROM <table> WHERE [conditions] ORDER BY rowid DESC LIMIT 1)
+   - If date-based ordering is relevant, use: ORDER BY "Date" ASC, rowid DESC LIMIT 1 (to get the oldest date, which appears last when ordered DESC)
+   - Or simply: ORDER BY rowid DESC LIMIT 1 (to get the row with highest rowid, typically the most recent)
+   - Always quote column names in ORDER BY: ORDER BY "Date" NOT ORDER BY Date
+8. When user refers to "last row", "last data", "that row" - look at conversation history to understand which row they're referring to from the previous query results
+9. For matching specific values mentioned (like names), use COLLATE NOCASE for case-insensitive matching
+10. Return ONLY the SQL - no explanations, markdown, or code blocks
+
+Examples:
+- "increase Nike sales by 10%":
+  UPDATE <table> SET "RetailDollars" = "RetailDollars" * 1.10 WHERE UPPER("Brand") = UPPER('NIKE')
+
+- "set all units to 0 for Adidas in December":
+  UPDATE <table> SET "Units" = 0 WHERE UPPER("Brand") = UPPER('ADIDAS') AND "ME_PERIOD" LIKE '%DEC%'
+
+- "change the last row's Lead Owner from Becky Arellano to Joyce Byres":
+  UPDATE <table> SET "Lead Owner" = 'Joyce Byres' WHERE rowid = (SELECT rowid FROM <table> WHERE "Lead Owner" COLLATE NOCASE = 'Becky Arellano' ORDER BY rowid DESC LIMIT 1)
+
+- "update lead owner from Becky arellano to Joyce byres for the last data":
+  UPDATE <table> SET "Lead Owner" = 'Joyce Byres' WHERE rowid = (SELECT rowid FROM <table> WHERE "Lead Owner" COLLATE NOCASE = 'Becky Arellano' ORDER BY rowid DESC LIMIT 1)
+
+- "change the last data lead owner from Becky arellano to Joyce byres":
+  UPDATE <table> SET "Lead Owner" = 'Joyce Byres' WHERE rowid = (SELECT rowid FROM <table> WHERE "Lead Owner" COLLATE NOCASE = 'Becky Arellano' ORDER BY rowid DESC LIMIT 1)
+
+- "change name from John to Jane":
+  UPDATE <table> SET "First Name" = 'Jane' WHERE "First Name" COLLATE NOCASE = 'John'
+"""
+
+# UPDATE statements are short; deterministic output also makes the prompt cache below consistent
+UPDATE_SQL_GENERATION_CONFIG = {"temperature": 0, "max_output_tokens": 256}
+
+# Once this many characters have streamed in, the reply must have started with an UPDATE
+UPDATE_SQL_CHECK_CHARS = 24
+_UPDATE_START_RE = re.compile(r"\s*(```(sql)?\s*)?UPDATE\b", re.IGNORECASE)
+
+# Generated UPDATE statements are reused for repeated prompts, up to this many
+UPDATE_SQL_CACHE_SIZE = 256
+
 
 class DataEditor:
     """Service for editing data in tables."""
 
+    def __init__(self):
+        """Initialize data editor."""
+        # blake2b digest of the full prompt -> generated UPDATE SQL
+        self._update_sql_cache: Dict[str, str] = {}
+        # Edits run in threadpool handlers, so cache reads and writes take this lock
+        self._update_sql_cache_lock = threading.Lock()
+
+    def _get_table(self, table_name: str, columns: List[str]) -> TableClause:
+        """Core table for an uploaded table, after checking it and the given columns exist.
+
+        Statements built from it are compiled once per shape by SQLAlchemy's statement cache, and
+        table and column names come from the schema rather than being pasted into SQL text.
+        """
+        known_columns = sql_executor.get_table_schema(table_name)["columns"]
+        unknown = [col for col in columns if col not in known_columns]
+        if unknown:
+            raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+        return table(table_name, *(column(col) for col in known_columns))
+
     def update_row(
         self,
         table_name: str,
@@ -21,13 +104,11 @@ class DataEditor:
         """Update a single row by row ID."""
         try:
             # Build UPDATE statement
-            set_clause = ", ".join([f'"{col}" = :{col}' for col in updates.keys()])
-            query = f'UPDATE {table_name} SET {set_clause} WHERE rowid = :row_id'
-
-            params = {**updates, "row_id": row_id}
+            sa_table = self._get_table(table_name, list(updates))
+            stmt = update(sa_table).where(ROWID == row_id).values(updates)
 
             with engine.begin() as conn:
-                result = conn.execute(text(query), params)
+                result = conn.execute(stmt)
 
             return {
                 "success": True,
@@ -41,6 +122,53 @@ class DataEditor:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            # Not inside the try, whose except would report a committed write as failed;
+            # dropping cached reads after a failed write is harmless
+            sql_executor.invalidate_table(table_name)
+
+    def update_rows(
+        self,
+        table_name: str,
+        row_updates: List[Tuple[int, Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Update several rows by row ID in one transaction.
+
+        Rows that set the same columns share one UPDATE, executed once with all their parameter sets.
+        """
+        try:
+            sa_table = self._get_table(table_name, list({col for _, updates in row_updates for col in updates}))
+
+            # (columns) -> parameter sets; bind names are positional so any column name works
+            batches: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for row_id, updates in row_updates:
+                columns = tuple(updates)
+                params = {f"v{i}": updates[col] for i, col in enumerate(columns)}
+                params["row_id"] = row_id
+                batches.setdefault(columns, []).append(params)
+
+            rows_affected = 0
+            with engine.begin() as conn:
+                for columns, param_sets in batches.items():
+                    stmt = update(sa_table).where(ROWID == bindparam("row_id")).values(
+                        {col: bindparam(f"v{i}") for i, col in enumerate(columns)}
+                    )
+                    rows_affected += conn.execute(stmt, param_sets).rowcount
+
+            return {
+                "success": True,
+                "rows_affected": rows_affected,
+                "message": f"Updated {rows_affected} row(s)"
+            }
+
+        except Exception as e:
+            logger.error(f"Error updating rows: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        finally:
+            sql_executor.invalidate_table(table_name)
 
     def insert_row(
         self,
@@ -49,12 +177,11 @@ class DataEditor:
     ) -> Dict[str, Any]:
         """Insert a new row."""
         try:
-            columns = ", ".join([f'"{col}"' for col in data.keys()])
-            placeholders = ", ".join([f":{col}" for col in data.keys()])
-            query = f'INSERT INTO {table_name} ({columns}) VALUES ({placeholders})'
+            sa_table = self._get_table(table_name, list(data))
+            stmt = insert(sa_table).values(data)
 
             with engine.begin() as conn:
-                result = conn.execute(text(query), data)
+                result = conn.execute(stmt)
 
             return {
                 "success": True,
@@ -67,6 +194,41 @@ class DataEditor:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            sql_executor.invalidate_table(table_name)
+
+    def insert_rows(
+        self,
+        table_name: str,
+        rows: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Insert several rows in one transaction, one executemany per set of columns."""
+        try:
+            sa_table = self._get_table(table_name, list({col for row in rows for col in row}))
+
+            batches: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for row in rows:
+                batches.setdefault(tuple(row), []).append(row)
+
+            with engine.begin() as conn:
+                for columns, batch in batches.items():
+                    stmt = insert(sa_table).values({col: bindparam(f"v{i}") for i, col in enumerate(columns)})
+                    conn.execute(stmt, [{f"v{i}": row[col] for i, col in enumerate(columns)} for row in batch])
+
+            return {
+                "success": True,
+                "rows_affected": len(rows),
+                "message": f"Inserted {len(rows)} row(s)"
+            }
+
+        except Exception as e:
+            logger.error(f"Error inserting rows: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        finally:
+            sql_executor.invalidate_table(table_name)
 
     def delete_row(
         self,
@@ -75,10 +237,11 @@ class DataEditor:
     ) -> Dict[str, Any]:
         """Delete a row by row ID."""
         try:
-            query = f'DELETE FROM {table_name} WHERE rowid = :row_id'
+            sa_table = self._get_table(table_name, [])
+            stmt = delete(sa_table).where(ROWID == row_id)
 
             with engine.begin() as conn:
-                result = conn.execute(text(query), {"row_id": row_id})
+                result = conn.execute(stmt)
 
             return {
                 "success": True,
@@ -92,6 +255,8 @@ class DataEditor:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            sql_executor.invalidate_table(table_name)
 
     def ai_batch_edit(
         self,
@@ -131,6 +296,8 @@ class DataEditor:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            sql_executor.invalidate_table(table_name)
 
     def _generate_update_sql(
         self,
@@ -149,60 +316,43 @@ class DataEditor:
                 history_text += f"{role}: {msg['content']}\n"
             history_text += "\nUse the conversation above to understand contextual references.\n"
 
-        prompt = f"""You are a SQL expert. Generate an UPDATE statement for SQLite based on the user's instruction.
-
-Table: {table_name}
+        prompt = f"""{UPDATE_SQL_PROMPT_RULES}
+Table: {table_name} (use it wherever the requirements and examples say <table>)
 
 Data Schema:
 {catalog_summary}
 {history_text}
 User Instruction: "{user_instruction}"
 
-CRITICAL REQUIREMENTS:
-1. Generate ONLY an UPDATE statement - no SELECT, INSERT, DELETE, or DROP
-2. Use EXACT column names from schema (case-sensitive column names in quotes!)
-   - ALWAYS quote column names with double quotes: "Column Name"
-   - If column has spaces: "Account Id", "Lead Owner", "Deal Stage" (MUST use quotes!)
-   - NEVER use underscores for spaces: "Account Id" NOT Account_Id
-   - Example: "Lead Owner" NOT Lead_Owner or LeadOwner
-3. Use proper SQL syntax for SQLite
-4. Be precise with WHERE clause to match user's intent
-5. Use mathematical operations correctly (e.g., "RetailDollars" * 1.10 for 10% increase)
-6. For string comparisons, use case-insensitive matching: UPPER("Column Name") = UPPER('value') or "Column Name" COLLATE NOCASE = 'value'
-7. For "last row" or "last data", identify the row using a subquery:
-   - Match the specific value mentioned (e.g., name) case-insensitively
-   - Use rowid in subquery to target the specific row: WHERE rowid = (SELECT rowid FROM {table_name} WHERE [conditions] ORDER BY rowid DESC LIMIT 1)
-   - If date-based ordering is relevant, use: ORDER BY "Date" ASC, rowid DESC LIMIT 1 (to get the oldest date, which appears last when ordered DESC)
-   - Or simply: ORDER BY rowid DESC LIMIT 1 (to get the row with highest rowid, typically the most recent)
-   - Always quote column names in ORDER BY: ORDER BY "Date" NOT ORDER BY Date
-8. When user refers to "last row", "last data", "that row" - look at conversation history to understand which row they're referring to from the previous query results
-9. For matching specific values mentioned (like names), use COLLATE NOCASE for case-insensitive matching
-10. Return ONLY the SQL - no explanations, markdown, or code blocks
-
-Examples:
-- "increase Nike sales by 10%":
-  UPDATE {table_name} SET "RetailDollars" = "RetailDollars" * 1.10 WHERE UPPER("Brand") = UPPER('NIKE')
-
-- "set all units to 0 for Adidas in December":
-  UPDATE {table_name} SET "Units" = 0 WHERE UPPER("Brand") = UPPER('ADIDAS') AND "ME_PERIOD" LIKE '%DEC%'
-
-- "change the last row's Lead Owner from Becky Arellano to Joyce Byres":
-  UPDATE {table_name} SET "Lead Owner" = 'Joyce Byres' WHERE rowid = (SELECT rowid FROM {table_name} WHERE "Lead Owner" COLLATE NOCASE = 'Becky Arellano' ORDER BY rowid DESC LIMIT 1)
-
-- "update lead owner from Becky arellano to Joyce byres for the last data":
-  UPDATE {table_name} SET "Lead Owner" = 'Joyce Byres' WHERE rowid = (SELECT rowid FROM {table_name} WHERE "Lead Owner" COLLATE NOCASE = 'Becky Arellano' ORDER BY rowid DESC LIMIT 1)
-
-- "change the last data lead owner from Becky arellano to Joyce byres":
-  UPDATE {table_name} SET "Lead Owner" = 'Joyce Byres' WHERE rowid = (SELECT rowid FROM {table_name} WHERE "Lead Owner" COLLATE NOCASE = 'Becky Arellano' ORDER BY rowid DESC LIMIT 1)
-
-- "change name from John to Jane":
-  UPDATE {table_name} SET "First Name" = 'Jane' WHERE "First Name" COLLATE NOCASE = 'John'
-
 Generate the UPDATE statement:"""
 
+        # The same instruction against the same table, catalog and history gets the same SQL
+        prompt_key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+        with self._update_sql_cache_lock:
+            cached_sql = self._update_sql_cache.get(prompt_key)
+        if cached_sql is not None:
+            logger.info("Reusing UPDATE SQL generated for an identical prompt")
+            return cached_sql
+
         try:
-            response = gemini_service.model.generate_content(prompt)
-            sql = response.text.strip()
+            response = gemini_service.model.generate_content(
+                prompt,
+                stream=True,
+                generation_config=UPDATE_SQL_GENERATION_CONFIG
+            )
+            sql = ""
+            for chunk in response:
+                # chunk.text raises on chunks without text, e.g. a final one carrying only finish_reason
+                if chunk.candidates:
+                    sql += "".join(part.text for part in chunk.candidates[0].content.parts)
+                # Stop reading as soon as the start shows the reply is not an UPDATE
+                if len(sql) >= UPDATE_SQL_CHECK_CHARS and not _UPDATE_START_RE.match(sql):
+                    raise ValueError("Generated SQL is not an UPDATE statement")
+
+            # A statement cut off at the token limit could still parse with a shorter WHERE clause
+            if response.candidates and response.candidates[0].finish_reason == glm.Candidate.FinishReason.MAX_TOKENS:
+                raise ValueError("Generated UPDATE statement was cut off")
+            sql = sql.strip()
 
             # Clean markdown if present
             if sql.startswith("```sql"):
@@ -214,10 +364,17 @@ Generate the UPDATE statement:"""
 
             sql = sql.strip()
 
+            # The model may copy the examples' <table> placeholder instead of the real name
+            sql = sql.replace("<table>", f'"{table_name}"')
+
             # Validate it's an UPDATE statement
             if not sql.upper().startswith("UPDATE"):
                 raise ValueError("Generated SQL is not an UPDATE statement")
 
+            with self._update_sql_cache_lock:
+                if len(self._update_sql_cache) >= UPDATE_SQL_CACHE_SIZE:
+                    self._update_sql_cache.pop(next(iter(self._update_sql_cache)), None)
+                self._update_sql_cache[prompt_key] = sql
             return sql
 
         except Exception as e:
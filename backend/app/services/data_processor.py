@@ -50,8 +50,12 @@ def get_sample_rows(df: pd.DataFrame, n: int = 20) -> List[Dict[str, Any]]:
     """Get sample rows from DataFrame."""
     sample_size = min(n, len(df))
     sample_df = df.head(sample_size)
-    # Replace NaN with None for JSON serialization
-    return sample_df.replace({pd.NA: None, pd.NaT: None}).to_dict(orient='records')
+    # Replace NaN/NA/NaT with None for JSON serialization, one masked pass per column
+    values = {
+        col: sample_df[col].astype(object).where(sample_df[col].notna(), None).tolist()
+        for col in sample_df.columns
+    }
+    return [dict(zip(values, row)) for row in zip(*values.values())]
 
 
 def infer_types(df: pd.DataFrame) -> Dict[str, str]:
@@ -88,7 +92,7 @@ def get_basic_stats(df: pd.DataFrame) -> Dict[str, Any]:
         stats["numeric_stats"] = df[numeric_cols].describe().to_dict()
     
     # Categorical cardinality
-    categorical_cols = df.select_dtypes(include=['object']).columns
+    categorical_cols = df.select_dtypes(include=['object', 'string']).columns
     if len(categorical_cols) > 0:
         stats["categorical_cardinality"] = {
             col: df[col].nunique() for col in categorical_cols
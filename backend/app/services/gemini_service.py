@@ -7,6 +7,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# The SQL prompt only quotes this many of the most recent messages (last 3 exchanges)
+SQL_PROMPT_HISTORY_MESSAGES = 6
+
 
 class GeminiService:
     """Service for interacting with Gemini API."""
@@ -825,7 +828,7 @@ Format as markdown. Be factual and concise."""
         previous_sql_queries = []
         if conversation_history and len(conversation_history) > 1:
             history_text = "\n\nPrevious conversation:\n"
-            for msg in conversation_history[-6:]:  # Last 3 exchanges (6 messages)
+            for msg in conversation_history[-SQL_PROMPT_HISTORY_MESSAGES:]:
                 role = "User" if msg["role"] == "user" else "Assistant"
                 content = msg['content']
                 # Include tool calls (SQL queries) if available to understand what was queried
@@ -1,14 +1,38 @@
 """SQL execution service."""
 import pandas as pd
 import sqlite3
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import text
 from app.config import settings
 from app.database.connection import engine
 import re
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Reads of a table (row counts, table pages, columns) are reused for this many seconds,
+# up to this many entries in total; writes through this app drop a table's entries at once
+READ_CACHE_TTL = 30
+READ_CACHE_SIZE = 1024
+
+# Suffix of the FTS5 table that indexes an uploaded table for substring search
+SEARCH_INDEX_SUFFIX = "_fts"
+
+# Schemas of uploaded tables only change when a table is recreated or dropped; up to this many are kept
+SCHEMA_CACHE_SIZE = 512
+
+# Tables with at least this many rows get an index on each of their first few columns,
+# so sorting the table view walks an index instead of sorting the whole table
+SORT_INDEX_MIN_ROWS = 1000
+SORT_INDEX_MAX_COLUMNS = 10
+
+
+def _quote_identifier(name: str) -> str:
+    """Double-quote an SQL identifier, doubling any double quotes inside it."""
+    return '"' + name.replace('"', '""') + '"'
+
 
 class SQLExecutor:
     """Service for executing SQL queries."""
@@ -16,6 +40,11 @@ class SQLExecutor:
     def __init__(self):
         """Initialize SQL executor."""
         self.connection = engine.raw_connection()
+        # (table_name, key) -> (expires_at, result)
+        self._read_cache: Dict[Tuple[str, Tuple], Tuple[float, Any]] = {}
+        self._schema_cache: Dict[str, Dict[str, Any]] = {}
+        # Sync route handlers share these caches across threadpool threads
+        self._cache_lock = threading.Lock()
     
     def create_table_from_dataframe(
         self,
@@ -34,13 +63,124 @@ class SQLExecutor:
             if_exists='replace',
             index=False
         )
+        self.invalidate_table(table_name)
+        self.invalidate_schema(table_name)
+        if engine.dialect.name == "sqlite":
+            self._create_search_index(table_name, [str(col) for col in df.columns])
+            if len(df) >= SORT_INDEX_MIN_ROWS:
+                self._create_sort_indexes(table_name, [str(col) for col in df.columns[:SORT_INDEX_MAX_COLUMNS]])
+
+    def _create_sort_indexes(self, table_name: str, columns: List[str]) -> None:
+        """Index columns for the table view's sorts (COLLATE NOCASE, matching its ORDER BY).
+
+        Like the search index these only speed up reads, so a column that cannot be indexed is skipped.
+        """
+        for i, col in enumerate(columns):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f'CREATE INDEX IF NOT EXISTS "ix_{table_name}_{i}" '
+                        f'ON "{table_name}" ({_quote_identifier(col)} COLLATE NOCASE)'
+                    ))
+            except Exception as e:
+                logger.warning(f"Skipping sort index on {table_name}.{col}: {str(e)}")
+
+    def _create_search_index(self, table_name: str, columns: List[str]) -> None:
+        """Build a trigram FTS5 index over a table's columns, kept in sync by triggers.
+
+        The index only speeds up search, so if FTS5 rejects the columns (e.g. one named "rank")
+        the table is left without it and search falls back to a scan.
+        """
+        fts_table = f"{table_name}{SEARCH_INDEX_SUFFIX}"
+        quoted_cols = [_quote_identifier(col) for col in columns]
+        cols = ", ".join(quoted_cols)
+        new_values = ", ".join(f"new.{col}" for col in quoted_cols)
+        old_values = ", ".join(f"old.{col}" for col in quoted_cols)
+        delete_old = f'INSERT INTO "{fts_table}"("{fts_table}", rowid, {cols}) VALUES (\'delete\', old.rowid, {old_values});'
+        insert_new = f'INSERT INTO "{fts_table}"(rowid, {cols}) VALUES (new.rowid, {new_values});'
+
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{fts_table}"'))
+                conn.execute(text(
+                    f'CREATE VIRTUAL TABLE "{fts_table}" USING fts5({cols}, content="{table_name}", '
+                    f'content_rowid="rowid", tokenize="trigram")'
+                ))
+                conn.execute(text(f'INSERT INTO "{fts_table}"(rowid, {cols}) SELECT rowid, {cols} FROM "{table_name}"'))
+                conn.execute(text(f'CREATE TRIGGER "{fts_table}_ai" AFTER INSERT ON "{table_name}" BEGIN {insert_new} END'))
+                conn.execute(text(f'CREATE TRIGGER "{fts_table}_ad" AFTER DELETE ON "{table_name}" BEGIN {delete_old} END'))
+                conn.execute(text(
+                    f'CREATE TRIGGER "{fts_table}_au" AFTER UPDATE ON "{table_name}" BEGIN {delete_old} {insert_new} END'
+                ))
+        except Exception as e:
+            logger.warning(f"Skipping search index for {table_name}: {str(e)}")
+
+    def has_search_index(self, table_name: str) -> bool:
+        """Whether a table has the FTS5 search index (tables uploaded before it existed do not)."""
+        if engine.dialect.name != "sqlite":
+            return False
+        with engine.connect() as conn:
+            return bool(conn.execute(
+                text("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name)"),
+                {"name": f"{table_name}{SEARCH_INDEX_SUFFIX}"},
+            ).scalar())
     
     def execute_query(
         self,
         table_name: str,
-        sql_query: str
+        sql_query: str,
+        max_rows: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
-        """Execute SQL query and return results."""
+        """Execute SQL query and return results (at most max_rows rows when given).
+
+        With params, the query is run as a text() statement with :name placeholders bound to them,
+        so the same SQL string (and the driver's prepared statement) is reused across values.
+        """
+        sql_query = self._prepare_query(table_name, sql_query)
+        
+        try:
+            # Execute query
+            logger.info(f"Executing SQL: {sql_query}")
+            query = text(sql_query) if params is not None else sql_query
+            if max_rows is None:
+                df = pd.read_sql_query(query, con=engine, params=params)
+            else:
+                # Read a single chunk so rows past the cap are never fetched
+                df = next(iter(pd.read_sql_query(query, con=engine, params=params, chunksize=max_rows)), None)
+                if df is None:
+                    return []
+            
+            # Convert to list of dicts
+            return df.replace({pd.NA: None, pd.NaT: None}).to_dict(orient='records')
+        except Exception as e:
+            error_msg = f"Error executing query: {str(e)}"
+            logger.error(f"{error_msg}. Query: {sql_query}")
+            raise ValueError(error_msg)
+    
+    def execute_query_rows(
+        self,
+        table_name: str,
+        sql_query: str,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[str], List[tuple]]:
+        """Execute a text() SQL query with :name params and return its column names and row tuples.
+
+        Rows come straight from the cursor, skipping the DataFrame and per-row dicts of execute_query.
+        """
+        sql_query = self._prepare_query(table_name, sql_query)
+        try:
+            logger.info(f"Executing SQL: {sql_query}")
+            with engine.connect() as conn:
+                result = conn.execute(text(sql_query), params or {})
+                return list(result.keys()), [tuple(row) for row in result]
+        except Exception as e:
+            error_msg = f"Error executing query: {str(e)}"
+            logger.error(f"{error_msg}. Query: {sql_query}")
+            raise ValueError(error_msg)
+    
+    def _prepare_query(self, table_name: str, sql_query: str) -> str:
+        """Validate the table name, normalize schema prefixes and check the query is a safe SELECT."""
         # Validate table name
         if not self._validate_table_name(table_name):
             raise ValueError(f"Invalid table name: {table_name}")
@@ -60,34 +200,75 @@ class SQLExecutor:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        try:
-            # Execute query
-            logger.info(f"Executing SQL: {sql_query}")
-            df = pd.read_sql_query(sql_query, con=engine)
-            
-            # Convert to list of dicts
-            return df.replace({pd.NA: None, pd.NaT: None}).to_dict(orient='records')
-        except Exception as e:
-            error_msg = f"Error executing query: {str(e)}"
-            logger.error(f"{error_msg}. Query: {sql_query}")
-            raise ValueError(error_msg)
+        return sql_query
+    
+    def count_rows(self, table_name: str, where_clause: str = "", params: Optional[Dict[str, Any]] = None) -> int:
+        """Count a table's rows matching an optional WHERE clause (with :name params), reusing recent counts."""
+        if not self._validate_table_name(table_name):
+            raise ValueError(f"Invalid table name: {table_name}")
+
+        params = params or {}
+        key = ("count", where_clause, tuple(sorted(params.items())))
+        total = self.get_cached_read(table_name, key)
+        if total is None:
+            with engine.connect() as conn:
+                total = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}" {where_clause}'), params).scalar_one()
+            self.cache_read(table_name, key, total)
+        return total
+
+    def get_cached_read(self, table_name: str, key: Tuple) -> Any:
+        """Result cached for a table under key within the last READ_CACHE_TTL seconds, else None."""
+        with self._cache_lock:
+            cached = self._read_cache.get((table_name, key))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        return None
+
+    def cache_read(self, table_name: str, key: Tuple, result: Any) -> None:
+        """Remember a read of a table until it expires or the table is written to."""
+        with self._cache_lock:
+            if len(self._read_cache) >= READ_CACHE_SIZE:
+                self._read_cache.pop(next(iter(self._read_cache)), None)
+            self._read_cache[(table_name, key)] = (time.monotonic() + READ_CACHE_TTL, result)
+
+    def invalidate_table(self, table_name: str) -> None:
+        """Forget cached reads of a table after its rows or columns change."""
+        with self._cache_lock:
+            for key in [key for key in list(self._read_cache) if key[0] == table_name]:
+                self._read_cache.pop(key, None)
     
     def get_table_schema(self, table_name: str) -> Dict[str, Any]:
-        """Get schema information for a table."""
+        """Get schema information for a table (cached until the table is recreated or dropped)."""
         if not self._validate_table_name(table_name):
             raise ValueError(f"Invalid table name: {table_name}")
         
+        with self._cache_lock:
+            schema = self._schema_cache.get(table_name)
+        if schema is not None:
+            return schema
+        
         try:
             df = pd.read_sql_query(
-                f"SELECT * FROM {table_name} LIMIT 0",
+                f'SELECT * FROM "{table_name}" LIMIT 0',
                 con=engine
             )
-            return {
+            schema = {
                 "columns": list(df.columns),
                 "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()}
             }
         except Exception as e:
             raise ValueError(f"Error getting schema: {str(e)}")
+        
+        with self._cache_lock:
+            if len(self._schema_cache) >= SCHEMA_CACHE_SIZE:
+                self._schema_cache.pop(next(iter(self._schema_cache)), None)
+            self._schema_cache[table_name] = schema
+        return schema
+    
+    def invalidate_schema(self, table_name: str) -> None:
+        """Forget a table's cached schema after it is recreated or dropped."""
+        with self._cache_lock:
+            self._schema_cache.pop(table_name, None)
     
     def _validate_table_name(self, table_name: str) -> bool:
         """Validate table name to prevent SQL injection."""
@@ -20,15 +20,8 @@ def get_file_path(file_id: str, file_extension: str) -> str:
 
 
 def get_catalog_path(file_id: str) -> str:
-    """Get the catalog text file path."""
-    return os.path.join(settings.CATALOG_DIR, f"{file_id}.txt")
-
-
-def save_file(file_content: bytes, file_path: str) -> None:
-    """Save file content to disk."""
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "wb") as f:
-        f.write(file_content)
+    """Get the catalog text file path (gzip-compressed)."""
+    return os.path.join(settings.CATALOG_DIR, f"{file_id}.txt.gz")
 
 
 def file_exists(file_path: str) -> bool:
@@ -1,6 +1,7 @@
 """Validation utilities."""
 from fastapi import UploadFile, HTTPException
 from app.config import settings
+import uuid
 
 
 def validate_file_type(filename: str) -> str:
@@ -14,6 +15,18 @@ def validate_file_type(filename: str) -> str:
     return ext
 
 
+def validate_uuid(value: str, name: str = "ID") -> str:
+    """Validate a user/session ID and return it in canonical dashed form.
+
+    Malformed IDs are rejected with a 400 before they reach a uuid column, where PostgreSQL
+    would raise a DataError (a 500) instead of simply finding no row.
+    """
+    try:
+        return str(uuid.UUID(value))
+    except (ValueError, AttributeError, TypeError):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+
 def validate_file_size(file: UploadFile) -> None:
     """Validate file size."""
     # Note: FastAPI doesn't provide file size before reading
@@ -0,0 +1,10 @@
+"""Test configuration: point the app at a throwaway SQLite database before it is imported."""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}")
+os.environ.setdefault("CATALOG_DIR", os.path.join(_tmp_dir, "catalog"))
@@ -0,0 +1,35 @@
+"""Tests for database initialization."""
+from sqlalchemy import inspect, text
+
+from app.database.connection import engine, init_db
+from app.models import catalog, chat, user  # noqa: F401  (registers the tables)
+
+
+def test_init_db_adds_columns_missing_from_existing_tables():
+    """A chat_messages table created before sql_query/sql_file_id gets them on startup."""
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE chat_messages DROP COLUMN sql_query"))
+        conn.execute(text("ALTER TABLE chat_messages DROP COLUMN sql_file_id"))
+
+    init_db()
+
+    columns = {column["name"] for column in inspect(engine).get_columns("chat_messages")}
+    assert {"sql_query", "sql_file_id"} <= columns
+
+
+def test_init_db_adds_file_status_to_existing_files_table():
+    """Files uploaded before the status column existed read back as "uploaded"."""
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE files DROP COLUMN status"))
+        conn.execute(text(
+            "INSERT INTO files (file_id, user_id, original_filename, file_type, file_path) "
+            "VALUES ('legacy_csv', 'u', 'legacy.csv', 'csv', 'catalog/legacy.csv')"
+        ))
+
+    init_db()
+
+    with engine.connect() as conn:
+        status = conn.execute(text("SELECT status FROM files WHERE file_id = 'legacy_csv'")).scalar_one()
+    assert status == "uploaded"
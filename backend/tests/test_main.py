@@ -0,0 +1,10 @@
+"""Tests for application setup."""
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.main import app
+
+
+def test_middleware_is_pure_asgi():
+    """No middleware uses BaseHTTPMiddleware, which adds a task and memory streams per request."""
+    for middleware in app.user_middleware:
+        assert not issubclass(middleware.cls, BaseHTTPMiddleware), middleware.cls.__name__
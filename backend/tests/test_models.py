@@ -0,0 +1,24 @@
+"""Tests for model column types."""
+import uuid
+
+from sqlalchemy import text
+
+from app.database.connection import SessionLocal, init_db
+from app.models import catalog, chat  # noqa: F401  (registers the tables init_db creates)
+from app.models.user import User
+
+
+def test_sqlite_stores_dashed_uuid_strings():
+    """SQLite keeps dashed 36-char IDs, so rows written before the Uuid type are still found."""
+    init_db()
+    legacy_id = str(uuid.uuid4())
+    with SessionLocal() as db:
+        db.execute(text("INSERT INTO users (user_id) VALUES (:user_id)"), {"user_id": legacy_id})
+        db.commit()
+        assert db.get(User, legacy_id) is not None
+
+        user = User()
+        db.add(user)
+        db.commit()
+        stored = db.execute(text("SELECT user_id FROM users WHERE user_id = :user_id"), {"user_id": user.user_id}).scalar()
+    assert stored == user.user_id and len(stored) == 36
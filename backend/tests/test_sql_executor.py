@@ -0,0 +1,62 @@
+"""Tests for table creation in the SQL executor."""
+import sys
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from app.database.connection import engine
+from app.services.sql_executor import sql_executor, SORT_INDEX_MIN_ROWS
+
+
+def test_reserved_fts_column_name_skips_search_index():
+    """A column FTS5 rejects ("rank") still uploads; the table just has no search index."""
+    df = pd.DataFrame({"name": ["a", "b"], "rank": [1, 2]})
+    sql_executor.create_table_from_dataframe(df, "reserved_rank")
+
+    assert not sql_executor.has_search_index("reserved_rank")
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM "reserved_rank"')).scalar_one() == 2
+
+
+def test_quoted_column_names_are_indexed():
+    """Column names containing double quotes are escaped in the search and sort indexes."""
+    df = pd.DataFrame({'a"b': [f"v{i}" for i in range(SORT_INDEX_MIN_ROWS)], "c": range(SORT_INDEX_MIN_ROWS)})
+    sql_executor.create_table_from_dataframe(df, "quoted_cols")
+
+    assert sql_executor.has_search_index("quoted_cols")
+    with engine.connect() as conn:
+        matches = conn.execute(text('SELECT COUNT(*) FROM "quoted_cols_fts" WHERE "quoted_cols_fts" MATCH \'"v99"\'')).scalar_one()
+        indexes = conn.execute(
+            text("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = 'quoted_cols'")
+        ).scalar_one()
+    assert matches == 11  # v99, v990..v999
+    assert indexes == 2
+
+
+def test_read_cache_is_safe_across_threads():
+    """Concurrent puts, evictions and invalidations never see the cache change mid-iteration."""
+    errors = []
+
+    def hammer(worker: int):
+        try:
+            for i in range(10000):
+                table_name = f"t{(worker + i) % 8}"
+                sql_executor.cache_read(table_name, ("page", worker, i), i)
+                sql_executor.get_cached_read(table_name, ("page", worker, i))
+                if i % 7 == 0:
+                    sql_executor.invalidate_table(table_name)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(worker,)) for worker in range(8)]
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads often enough to interleave inside cache operations
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
@@ -0,0 +1,16 @@
+"""Tests for request validators."""
+import pytest
+from fastapi import HTTPException
+
+from app.utils.validators import validate_uuid
+
+
+def test_validate_uuid_returns_canonical_form():
+    assert validate_uuid("C2EC136780FC4CC08D9E1D6ECAAB5237") == "c2ec1367-80fc-4cc0-8d9e-1d6ecaab5237"
+
+
+def test_validate_uuid_rejects_malformed_ids():
+    with pytest.raises(HTTPException) as exc_info:
+        validate_uuid("not-a-uuid", "user ID")
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Invalid user ID"
@@ -117,7 +117,9 @@ const InteractiveDataTable: React.FC<InteractiveDataTableProps> = ({ tableName,
 
   const columns = columnsData?.columns || data?.columns || [];
   const pagination = data?.pagination;
-  const rows = data?.data || [];
+  const rows = data?.rows || [];
+  // Rows are value arrays in the order of data.columns
+  const columnIndex = new Map((data?.columns || []).map((column, i) => [column, i] as [string, number]));
 
   if (!shouldShowTable) {
     return null;
@@ -300,13 +302,14 @@ const InteractiveDataTable: React.FC<InteractiveDataTableProps> = ({ tableName,
               ) : (
                 rows.map((row, idx) => (
                   <tr key={idx} className="hover:bg-gray-50 transition-colors">
-                    {columns.map((column) => (
-                      <td key={column} className="px-4 py-3 whitespace-nowrap text-sm text-gray-700">
-                        {row[column] !== null && row[column] !== undefined
-                          ? String(row[column])
-                          : '-'}
-                      </td>
-                    ))}
+                    {columns.map((column) => {
+                      const value = row[columnIndex.get(column) ?? -1];
+                      return (
+                        <td key={column} className="px-4 py-3 whitespace-nowrap text-sm text-gray-700">
+                          {value !== null && value !== undefined ? String(value) : '-'}
+                        </td>
+                      );
+                    })}
                   </tr>
                 ))
               )}
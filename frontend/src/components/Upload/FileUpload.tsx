@@ -1,6 +1,6 @@
 import React, { useState, useCallback, useEffect } from 'react';
 import { useDropzone } from 'react-dropzone';
-import { uploadFile, getCatalogs } from '../../services/api';
+import { uploadFile, waitForUpload, getCatalogs } from '../../services/api';
 import { useQueryClient, useQuery } from 'react-query';
 import InteractiveDataTable from '../DataTable/InteractiveDataTable';
 
@@ -153,8 +153,12 @@ const FileUpload: React.FC<FileUploadProps> = ({ userId }) => {
         let lastRowCount: number | null = null;
         for (const file of acceptedFiles) {
           const response = await uploadFile(userId, file);
-          lastFileId = response.file_id;
-          lastRowCount = response.row_count;
+          const info = await waitForUpload(response.file_id);
+          if (info.status === 'failed') {
+            throw new Error(`Processing ${file.name} failed`);
+          }
+          lastFileId = info.file_id;
+          lastRowCount = info.row_count;
         }
         // Update state after all files are processed
         // This will automatically save to localStorage and update the table
@@ -59,7 +59,16 @@ export interface UploadResponse {
   file_id: string;
   filename: string;
   status: string;
-  row_count: number;
+  row_count: number | null;
+}
+
+export interface FileInfo {
+  file_id: string;
+  filename: string;
+  file_type: string;
+  status: 'processing' | 'uploaded' | 'failed';
+  row_count: number | null;
+  created_at: string;
 }
 
 export interface CatalogSummary {
@@ -118,11 +127,22 @@ export const uploadFile = async (
   return response.data;
 };
 
-export const getFileInfo = async (fileId: string) => {
-  const response = await api.get(`/api/upload/${fileId}`);
+export const getFileInfo = async (fileId: string): Promise<FileInfo> => {
+  const response = await api.get<FileInfo>(`/api/upload/${fileId}`);
   return response.data;
 };
 
+// Uploads are processed in the background; poll until the file is uploaded or failed
+export const waitForUpload = async (fileId: string, intervalMs = 1000): Promise<FileInfo> => {
+  for (;;) {
+    const info = await getFileInfo(fileId);
+    if (info.status !== 'processing') {
+      return info;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
 export const deleteFile = async (fileId: string) => {
   const response = await api.delete(`/api/upload/${fileId}`);
   return response.data;
@@ -169,11 +189,21 @@ export interface UpdateRowRequest {
   updates: Record<string, any>;
 }
 
+export interface UpdateRowsRequest {
+  table_name: string;
+  rows: Array<{ row_id: number; updates: Record<string, any> }>;
+}
+
 export interface InsertRowRequest {
   table_name: string;
   data: Record<string, any>;
 }
 
+export interface InsertRowsRequest {
+  table_name: string;
+  rows: Array<Record<string, any>>;
+}
+
 export interface DeleteRowRequest {
   table_name: string;
   row_id: number;
@@ -198,11 +228,22 @@ export const updateRow = async (request: UpdateRowRequest): Promise<DataEditResp
   return response.data;
 };
 
+// Several rows in one request and one transaction
+export const updateRows = async (request: UpdateRowsRequest): Promise<DataEditResponse> => {
+  const response = await api.post<DataEditResponse>('/api/data/update-rows', request);
+  return response.data;
+};
+
 export const insertRow = async (request: InsertRowRequest): Promise<DataEditResponse> => {
   const response = await api.post<DataEditResponse>('/api/data/insert-row', request);
   return response.data;
 };
 
+export const insertRows = async (request: InsertRowsRequest): Promise<DataEditResponse> => {
+  const response = await api.post<DataEditResponse>('/api/data/insert-rows', request);
+  return response.data;
+};
+
 export const deleteRow = async (request: DeleteRowRequest): Promise<DataEditResponse> => {
   const response = await api.post<DataEditResponse>('/api/data/delete-row', request);
   return response.data;
@@ -220,11 +261,13 @@ export interface PaginatedDataParams {
   search?: string;
   sort_by?: string;
   sort_order?: 'asc' | 'desc';
+  after?: string;
 }
 
 export interface PaginatedDataResponse {
-  data: Array<Record<string, any>>;
   columns: string[];
+  // One array per row, with values in the order of columns
+  rows: Array<Array<any>>;
   pagination: {
     page: number;
     page_size: number;
@@ -232,6 +275,7 @@ export interface PaginatedDataResponse {
     total_pages: number;
     has_next: boolean;
     has_previous: boolean;
+    next_cursor: string | null;
   };
 }
 